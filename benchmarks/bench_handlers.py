@@ -0,0 +1,219 @@
+"""Offline benchmark of the bot's handler hot paths.
+
+Builds the real Application from main.py on top of RecordingRequest, so no Telegram
+connection is made, fills a Store with synthetic data and pushes synthetic updates
+through the handlers.
+
+    python benchmarks/bench_handlers.py --products 1000 --customers 10000 --orders 100000
+    python benchmarks/bench_handlers.py --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from telegram import Update
+
+from main import build_application, post_init
+from database.store import Customer, Store
+from handlers.broadcast import get_broadcaster
+from handlers.callbacks import encode_callback, ADD_TO_CART, CHECKOUT
+from benchmarks.fake_bot import BOT_USER, RecordingRequest
+
+ADMIN_ID = 1000
+FIRST_CUSTOMER_ID = 10_000_000
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+def populate_store(store: Store, products: int, customers: int, orders: int, seed: int = 1):
+    rng = random.Random(seed)
+    for i in range(products):
+        store.add_product(f"Product {i}", f"Description of product {i}", rng.uniform(1, 100),
+                          10 ** 9, f"https://example.com/images/{i}.jpg")
+    now = datetime.now()
+    product_ids = list(store.products)
+    for i in range(orders):
+        customer_id = FIRST_CUSTOMER_ID + rng.randrange(customers)
+        store.add_to_cart(customer_id, rng.choice(product_ids), rng.randint(1, 3))
+        order = store.create_order(customer_id)
+        order.date = now - timedelta(minutes=rng.randrange(60 * 24 * 60))
+        if rng.random() < 0.9:
+            store.complete_order(order.id)
+    for customer_id in range(FIRST_CUSTOMER_ID, FIRST_CUSTOMER_ID + customers):
+        store.customers.setdefault(customer_id, Customer(customer_id, "", {}, 0.0))
+    store.drain_changes()
+
+def _user(user_id: int) -> dict:
+    return {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+
+def _chat(user_id: int) -> dict:
+    return {'id': user_id, 'type': 'private'}
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def _update(self, payload: dict) -> Update:
+        self.update_id += 1
+        payload['update_id'] = self.update_id
+        return Update.de_json(payload, self.bot)
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {'message_id': self.update_id + 1, 'date': int(time.time()),
+                'chat': _chat(user_id), 'from': _user(user_id), **fields}
+
+    def command(self, user_id: int, text: str) -> Update:
+        command = text.split()[0]
+        return self._update({'message': self._message(
+            user_id, text=text, entities=[{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        )})
+
+    def callback(self, user_id: int, data: str) -> Update:
+        return self._update({'callback_query': {
+            'id': str(self.update_id + 1), 'from': _user(user_id), 'chat_instance': str(user_id),
+            'data': data, 'message': self._message(user_id, text="Products", **{'from': BOT_USER}),
+        }})
+
+    def successful_payment(self, user_id: int, order_id: int, total: float) -> Update:
+        return self._update({'message': self._message(user_id, successful_payment={
+            'currency': 'USD', 'total_amount': int(total * 100), 'invoice_payload': f"order_{order_id}",
+            'telegram_payment_charge_id': f"tg-{order_id}", 'provider_payment_charge_id': f"pp-{order_id}",
+        })})
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run_scenario(application, request: RecordingRequest, name: str, updates, memory: bool):
+    latencies = []
+    calls_before = request.total_calls()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for update in updates:
+        update_start = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - update_start)
+    # Include notifications the handlers handed off to the broadcaster
+    await get_broadcaster(application).join()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    count = len(latencies)
+    return {
+        'updates': count,
+        'throughput_per_s': count / elapsed if elapsed else 0.0,
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'api_calls_per_update': (request.total_calls() - calls_before) / count,
+        'peak_memory_kb': peak / 1024,
+    }
+
+async def run_benchmark(products: int, customers: int, orders: int, iterations: int, memory: bool) -> dict:
+    request = RecordingRequest()
+    application = build_application('123456:BENCHMARK', request=request)
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    application.bot_data['admins'] = [ADMIN_ID]
+
+    # Deliver background notifications as fast as the fake transport allows
+    broadcaster = get_broadcaster(application)
+    broadcaster.per_chat_interval = 0
+    broadcaster.global_bucket.rate = broadcaster.global_bucket.capacity = 10 ** 9
+
+    store: Store = application.bot_data['store']
+    populate_start = time.perf_counter()
+    populate_store(store, products, customers, orders)
+    populate_seconds = time.perf_counter() - populate_start
+
+    factory = UpdateFactory(application.bot)
+    # Fresh users so each one walks the whole purchase flow exactly once
+    users = [FIRST_CUSTOMER_ID + customers + i for i in range(iterations)]
+    product_ids = list(store.products)
+
+    scenarios = {}
+    async def scenario(name, build):
+        scenarios[name] = await run_scenario(application, request, name, [build(u) for u in users], memory)
+
+    await scenario('products', lambda u: factory.command(u, '/products'))
+    await scenario('add_to_cart', lambda u: factory.callback(u, encode_callback(ADD_TO_CART, product_ids[u % len(product_ids)])))
+    await scenario('checkout', lambda u: factory.callback(u, encode_callback(CHECKOUT)))
+    await scenario('pay', lambda u: factory.command(u, '/pay'))
+    pending = {u: store.get_pending_order(u) for u in users}
+    await scenario('successful_payment', lambda u: factory.successful_payment(u, pending[u].id, pending[u].total))
+    await scenario('support', lambda u: factory.command(u, '/support'))
+    users = [ADMIN_ID] * iterations
+    await scenario('dashboard', lambda u: factory.command(u, '/dashboard'))
+
+    await application.stop()
+    await application.shutdown()
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {'products': products, 'customers': customers, 'orders': orders,
+                   'iterations': iterations, 'memory': memory},
+        'populate_seconds': populate_seconds,
+        'scenarios': scenarios,
+        'api_calls': dict(request.calls),
+    }
+
+def print_results(results: dict, baseline: dict = None, threshold: float = 0.2) -> bool:
+    """Print a table of results; returns False if any scenario regressed past ``threshold``"""
+    ok = True
+    if baseline and baseline.get('config') != results['config']:
+        print(f"Warning: comparing against a run with a different config: {baseline.get('config')}")
+    print(f"{'scenario':<20}{'upd/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'calls/upd':>11}{'peak KB':>10}")
+    for name, stats in results['scenarios'].items():
+        line = (f"{name:<20}{stats['throughput_per_s']:>10.0f}{stats['p50_ms']:>10.3f}"
+                f"{stats['p99_ms']:>10.3f}{stats['api_calls_per_update']:>11.2f}{stats['peak_memory_kb']:>10.0f}")
+        previous = (baseline or {}).get('scenarios', {}).get(name)
+        if previous:
+            change = stats['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0.0
+            line += f"  p50 {change:+.0%}"
+            if change > threshold or stats['api_calls_per_update'] > previous['api_calls_per_update']:
+                line += "  REGRESSION"
+                ok = False
+        print(line)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--customers', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=200, help="updates per scenario")
+    parser.add_argument('--memory', action='store_true', help="trace peak memory (slows handlers down)")
+    parser.add_argument('--output', help="where to save the JSON results (default: benchmarks/results/)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.3, help="allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args.products, args.customers, args.orders, args.iterations, args.memory))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    ok = print_results(results, baseline, args.threshold)
+    print(f"Results saved to {output}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Memory and pickle size of the Store's records, compared with plain dataclasses.
+
+Builds the same synthetic customers and orders twice, once with the slotted records
+from database/store.py and once with the ``__dict__`` dataclasses they replaced, and
+reports resident size (tracemalloc), pickle size and pickle/unpickle time.
+
+    python benchmarks/bench_memory.py --customers 100000 --orders 300000
+"""
+import argparse
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.store import Customer, Order
+
+@dataclass
+class DictCustomer:
+    id: int
+    username: str
+    cart: Dict[int, int]
+    total_spent: float
+
+@dataclass
+class DictOrder:
+    id: int
+    customer_id: int
+    products: Dict[int, int]
+    total: float
+    status: str
+    date: datetime
+
+def build(customer_cls, order_cls, customers: int, orders: int, seed: int = 1):
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0)
+    records = [customer_cls(1_000_000 + i, "", {}, rng.uniform(0, 500)) for i in range(customers)]
+    for i in range(orders):
+        items = {rng.randrange(10_000): rng.randint(1, 3) for _ in range(rng.randint(1, 4))}
+        records.append(order_cls(i + 1, 1_000_000 + rng.randrange(customers), items, rng.uniform(1, 300),
+                                 "completed" if rng.random() < 0.9 else "pending",
+                                 now - timedelta(minutes=rng.randrange(60 * 24 * 90))))
+    return records
+
+def measure(name: str, customer_cls, order_cls, customers: int, orders: int) -> dict:
+    tracemalloc.start()
+    records = build(customer_cls, order_cls, customers, orders)
+    resident, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    data = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+    dump_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    pickle.loads(data)
+    load_seconds = time.perf_counter() - start
+    return {'name': name, 'resident_mb': resident / 2 ** 20, 'pickle_mb': len(data) / 2 ** 20,
+            'dump_s': dump_seconds, 'load_s': load_seconds}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=100_000)
+    parser.add_argument('--orders', type=int, default=300_000)
+    args = parser.parse_args()
+
+    rows = [
+        measure("dataclass", DictCustomer, DictOrder, args.customers, args.orders),
+        measure("slotted", Customer, Order, args.customers, args.orders),
+    ]
+    print(f"{'records':<12}{'resident MB':>13}{'pickle MB':>11}{'dump s':>9}{'load s':>9}")
+    for row in rows:
+        print(f"{row['name']:<12}{row['resident_mb']:>13.1f}{row['pickle_mb']:>11.1f}"
+              f"{row['dump_s']:>9.2f}{row['load_s']:>9.2f}")
+    before, after = rows
+    print(f"\nResident memory {after['resident_mb'] / before['resident_mb'] - 1:+.0%}, "
+          f"pickle size {after['pickle_mb'] / before['pickle_mb'] - 1:+.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Cold start of the bot compared with a /reload of its handlers.
+
+Writes a journal for a synthetic store, then starts the bot from it in fresh
+processes (interpreter start, imports, building the application and loading the
+store, up to post_init) and times ``reload_handlers`` on a running application.
+No Telegram connection is made (see fake_bot.py).
+
+    python benchmarks/bench_startup.py --orders 100000 --runs 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add the project directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+def child(data_path: str):
+    """Run in a fresh process: start the bot from ``data_path`` and print main.cold_start"""
+    import main
+    from benchmarks.fake_bot import RecordingRequest
+    from database.journal import JournalPersistence
+
+    async def start():
+        application = main.build_application('123456:BENCHMARK', persistence=JournalPersistence(filepath=data_path),
+                                             request=RecordingRequest())
+        await application.initialize()
+        await main.post_init(application)
+        print(json.dumps(main.cold_start), flush=True)
+        await application.shutdown()
+
+    asyncio.run(start())
+
+async def write_store(data_path: str, products: int, customers: int, orders: int):
+    from benchmarks.bench_handlers import populate_store
+    from database.journal import StoreJournal
+    from database.store import Store
+
+    store = Store()
+    populate_store(store, products, customers, orders)
+    journal = StoreJournal(data_path)
+    journal.load(fallback=store)
+    await journal.close()
+
+async def time_reloads(data_path: str, runs: int) -> list:
+    import main
+    from benchmarks.fake_bot import RecordingRequest
+    from database.journal import JournalPersistence
+    from handlers.reload import reload_handlers
+
+    application = main.build_application('123456:BENCHMARK', persistence=JournalPersistence(filepath=data_path),
+                                         request=RecordingRequest())
+    await application.initialize()
+    await main.post_init(application)
+    seconds = [reload_handlers(application, main.register_handlers) for _ in range(runs)]
+    await application.shutdown()
+    return seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=10_000)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--child', metavar='DATA_PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, 'store_bot_data')
+        asyncio.run(write_store(data_path, args.products, args.customers, args.orders))
+
+        starts = []
+        for _ in range(args.runs):
+            begin = time.perf_counter()
+            output = subprocess.run([sys.executable, __file__, '--child', data_path],
+                                    check=True, capture_output=True, text=True).stdout
+            wall = time.perf_counter() - begin
+            starts.append(dict(json.loads(output.splitlines()[-1]), process=wall))
+        reloads = asyncio.run(time_reloads(data_path, args.runs))
+
+    print(f"Cold start, median of {args.runs} runs ({args.orders} orders, {args.customers} customers):")
+    for key, label in (('process', "process launch to ready"), ('imports', "imports"),
+                       ('initialize', "build and load store")):
+        print(f"  {label:<26}{statistics.median(run[key] for run in starts):>8.3f} s")
+    print(f"Handler reload, median of {args.runs} runs:{statistics.median(reloads) * 1000:>10.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+class RecordingRequest(BaseRequest):
+    """Bot API transport that answers every call locally and records it.
+
+    Requests still go through python-telegram-bot's full serialization path, so the
+    measured cost of a handler includes building the API payloads; only the network
+    round trip is replaced by a canned response.
+    """
+
+    def __init__(self):
+        self.calls: Counter = Counter()  # endpoint: number of calls
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _message(self, chat_id, photo: bool = False) -> dict:
+        self._message_id += 1
+        message = {
+            'message_id': self._message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id or 0), 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if photo:
+            file_id = f"photo-{self._message_id}"
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 800, 'height': 800}]
+        return message
+
+    def _result(self, endpoint: str, params: dict):
+        if endpoint == 'getMe':
+            return BOT_USER
+        chat_id = params.get('chat_id')
+        if endpoint == 'sendMediaGroup':
+            media = params.get('media') or []
+            return [self._message(chat_id, photo=True) for _ in media]
+        if endpoint in ('sendMessage', 'sendPhoto', 'sendDocument', 'sendInvoice', 'editMessageText'):
+            return self._message(chat_id, photo=endpoint == 'sendPhoto')
+        return True
+
+    async def do_request(self, url, method, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        start = time.perf_counter()
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        body = json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode()
+        self.calls[endpoint] += 1
+        self.durations[endpoint].append(time.perf_counter() - start)
+        return 200, body
@@ -0,0 +1,242 @@
+"""Columnar sales data for the admin /report command.
+
+SalesLedger keeps every completed order in NumPy arrays: one row per line item
+(order id, customer id, product id, quantity, unit price, timestamp) and one row per
+order. Reports are then vectorized group-bys (``np.bincount`` over product ids and
+days) instead of Python loops over ``Store.orders``.
+
+Orders only record their total, not the price paid for each product. Unit prices
+are the current product prices, scaled so each order's line items add up to its
+total. If any product of an order no longer exists, the total is split evenly over
+its units instead.
+"""
+import asyncio
+import itertools
+import weakref
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from database.store import Store
+
+DAY = 86400
+ARCHIVE_CHUNK = 50000  # archive rows turned into arrays at a time
+
+def _read_rows(rows: Iterable[tuple]) -> Optional[Dict[str, np.ndarray]]:
+    """Columns of (id, customer_id, total, timestamp, items) rows, or None if there are none.
+
+    Rows are converted ARCHIVE_CHUNK at a time, so a large archive is never held as one
+    list of tuples.
+    """
+    rows = iter(rows)
+    chunks = []
+    while True:
+        chunk = list(itertools.islice(rows, ARCHIVE_CHUNK))
+        if not chunk:
+            break
+        count = len(chunk)
+        chunks.append({
+            'order_id': np.fromiter((row[0] for row in chunk), np.int64, count),
+            'customer_id': np.fromiter((row[1] for row in chunk), np.int64, count),
+            'total': np.fromiter((row[2] for row in chunk), np.float64, count),
+            'timestamp': np.fromiter((row[3] for row in chunk), np.int64, count),
+            'items': np.frombuffer(b"".join(row[4] for row in chunk), np.int64).reshape(-1, 2),
+            'item_count': np.fromiter((len(row[4]) // 16 for row in chunk), np.int64, count),
+        })
+    if not chunks:
+        return None
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+class SalesLedger:
+    """Completed orders of one store, as columns, caught up by ``refresh``.
+
+    The archive is read once, by ``load_archive`` in a worker thread or else by the first
+    ``refresh``; after that only orders in ``Store.completion_log`` since the previous
+    refresh are added. A bitmap by order id keeps an order that
+    was archived after it was added from being counted twice.
+    """
+
+    LINE_COLUMNS = ('order_id', 'customer_id', 'product_id', 'quantity', 'unit_price', 'timestamp')
+    ORDER_COLUMNS = ('order_id', 'customer_id', 'total', 'timestamp')
+
+    def __init__(self, store: Store):
+        # A proxy, so the ledger does not keep its store alive
+        self.store = weakref.proxy(store)
+        # Columns are over-allocated and doubled when full; only the first _line_count
+        # or _order_count entries are data
+        self._lines: Dict[str, np.ndarray] = {
+            name: np.empty(0, np.float64 if name == 'unit_price' else np.int64) for name in self.LINE_COLUMNS
+        }
+        self._orders: Dict[str, np.ndarray] = {
+            name: np.empty(0, np.float64 if name == 'total' else np.int64) for name in self.ORDER_COLUMNS
+        }
+        self._line_count = 0
+        self._order_count = 0
+        self._included = np.zeros(0, dtype=bool)  # indexed by order id
+        self._log_position = 0
+        self._archive_loaded = False
+        self._loading = asyncio.Lock()
+
+    @property
+    def lines(self) -> Dict[str, np.ndarray]:
+        return {name: column[:self._line_count] for name, column in self._lines.items()}
+
+    @property
+    def orders(self) -> Dict[str, np.ndarray]:
+        return {name: column[:self._order_count] for name, column in self._orders.items()}
+
+    def __len__(self):
+        return self._line_count
+
+    async def load_archive(self) -> int:
+        """Read the archive in a worker thread, once; returns how many orders were added.
+
+        Awaiting this before ``refresh`` keeps the first report from blocking the event
+        loop while the whole archive is read.
+        """
+        async with self._loading:
+            if self._archive_loaded:
+                return 0
+            columns = None
+            if self.store.archive is not None:
+                columns = await asyncio.to_thread(_read_rows, self.store.archive.sales_rows())
+            self._archive_loaded = True
+            return self._append(columns) if columns is not None else 0
+
+    def refresh(self) -> int:
+        """Add orders completed since the last refresh; returns how many were added"""
+        added = 0
+        if not self._archive_loaded:
+            if self.store.archive is not None:
+                columns = _read_rows(self.store.archive.sales_rows())
+                added += self._append(columns) if columns is not None else 0
+            self._archive_loaded = True
+        rows = []
+        log = self.store.completion_log
+        for order_id in log[self._log_position:]:
+            order = self.store.orders_by_id.get(order_id)
+            if order is None and self.store.archive is not None:
+                # Archived since it was completed
+                order = self.store.archive.get(order_id)
+            # A rolled back backend transaction can leave an entry for an order that is not completed
+            if order is not None and order.status == "completed":
+                rows.append((order.id, order.customer_id, order.total, order.timestamp, order.__getstate__()[2]))
+        self._log_position = len(log)
+        columns = _read_rows(rows)
+        return added + (self._append(columns) if columns is not None else 0)
+
+    def _append(self, columns: Dict[str, np.ndarray]) -> int:
+        order_ids = columns['order_id']
+        if order_ids.max() >= len(self._included):
+            grown = np.zeros(max(int(order_ids.max()) + 1, 2 * len(self._included)), bool)
+            grown[:len(self._included)] = self._included
+            self._included = grown
+        # First occurrence of each order not added before
+        _, first = np.unique(order_ids, return_index=True)
+        keep = np.zeros(len(order_ids), bool)
+        keep[first] = True
+        keep &= ~self._included[order_ids]
+        if not keep.any():
+            return 0
+        line_keep = np.repeat(keep, columns['item_count'])
+        order_ids = order_ids[keep]
+        self._included[order_ids] = True
+
+        customer_ids = columns['customer_id'][keep]
+        totals = columns['total'][keep]
+        timestamps = columns['timestamp'][keep]
+        items = columns['items'][line_keep]
+        line_order = np.repeat(np.arange(len(order_ids)), columns['item_count'][keep])
+        product_ids, quantities = items[:, 0], items[:, 1]
+
+        self._order_count = self._extend(self._orders, self._order_count, order_id=order_ids,
+                                         customer_id=customer_ids, total=totals, timestamp=timestamps)
+        self._line_count = self._extend(self._lines, self._line_count, order_id=order_ids[line_order],
+                                        customer_id=customer_ids[line_order],
+                                        product_id=product_ids, quantity=quantities,
+                                        unit_price=self._unit_prices(product_ids, quantities, line_order, totals),
+                                        timestamp=timestamps[line_order])
+        return len(order_ids)
+
+    def _unit_prices(self, product_ids, quantities, line_order, totals) -> np.ndarray:
+        products = self.store.products
+        known = np.fromiter(products.keys(), np.int64, len(products))
+        prices = np.full(max(int(known.max(initial=0)), int(product_ids.max(initial=0))) + 1, np.nan)
+        prices[known] = np.fromiter((product.price for product in products.values()), np.float64, len(products))
+        list_prices = prices[product_ids]
+
+        orders = len(totals)
+        subtotals = np.bincount(line_order, weights=np.nan_to_num(list_prices * quantities), minlength=orders)
+        missing = np.bincount(line_order, weights=np.isnan(list_prices), minlength=orders) > 0
+        units = np.bincount(line_order, weights=quantities, minlength=orders)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = totals / subtotals
+            per_unit = totals / units
+        scaled = ~missing & (subtotals > 0)
+        return np.where(scaled[line_order], list_prices * scale[line_order], per_unit[line_order])
+
+    @staticmethod
+    def _extend(columns: Dict[str, np.ndarray], length: int, **values: np.ndarray) -> int:
+        """Write values after the first length rows, doubling full columns; returns the new length"""
+        for name, array in values.items():
+            column = columns[name]
+            end = length + len(array)
+            if end > len(column):
+                grown = np.empty(max(end, 2 * len(column)), column.dtype)
+                grown[:length] = column[:length]
+                columns[name] = column = grown
+            column[length:end] = array
+        return end
+
+    def report(self, start: Optional[int] = None, end: Optional[int] = None, top: int = 10) -> dict:
+        """Sales of orders placed in [start, end), as epoch seconds; None leaves a side open"""
+        lines, orders = self.lines, self.orders
+        line_mask = np.ones(len(lines['timestamp']), bool)
+        order_mask = np.ones(len(orders['timestamp']), bool)
+        if start is not None:
+            line_mask &= lines['timestamp'] >= start
+            order_mask &= orders['timestamp'] >= start
+        if end is not None:
+            line_mask &= lines['timestamp'] < end
+            order_mask &= orders['timestamp'] < end
+
+        product_ids = lines['product_id'][line_mask]
+        quantities = lines['quantity'][line_mask]
+        revenue = quantities * lines['unit_price'][line_mask]
+        product_revenue = np.bincount(product_ids, weights=revenue)
+        product_units = np.bincount(product_ids, weights=quantities)
+        sold = np.flatnonzero(product_units)
+        by_revenue = sold[np.argsort(-product_revenue[sold], kind='stable')]
+
+        totals = orders['total'][order_mask]
+        days = orders['timestamp'][order_mask] // DAY
+        first_day = int(days.min()) if len(days) else 0
+        daily_revenue = np.bincount(days - first_day, weights=totals)
+        daily_orders = np.bincount(days - first_day)
+        active = np.flatnonzero(daily_orders)
+
+        _, orders_per_customer = np.unique(orders['customer_id'][order_mask], return_counts=True)
+        customers = len(orders_per_customer)
+        order_count = len(totals)
+        return {
+            'revenue': float(totals.sum()),
+            'orders': order_count,
+            'units': int(quantities.sum()),
+            'customers': customers,
+            'average_order_value': float(totals.sum()) / order_count if order_count else 0.0,
+            # Share of this period's customers who ordered more than once in it
+            'repeat_customer_rate': float((orders_per_customer > 1).sum()) / customers if customers else 0.0,
+            'top_products': [(int(pid), int(product_units[pid]), float(product_revenue[pid])) for pid in by_revenue[:top]],
+            'products': [(int(pid), int(product_units[pid]), float(product_revenue[pid])) for pid in by_revenue],
+            'daily': [((first_day + int(day)) * DAY, int(daily_orders[day]), float(daily_revenue[day])) for day in active],
+        }
+
+_ledgers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def get_sales_ledger(store: Store) -> SalesLedger:
+    ledger: Optional[SalesLedger] = _ledgers.get(store)
+    if ledger is None:
+        ledger = _ledgers[store] = SalesLedger(store)
+    return ledger
@@ -0,0 +1,93 @@
+import sqlite3
+from typing import Iterable, Iterator, List, Optional
+
+from database.store import Order
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY,
+    customer_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    total REAL NOT NULL,
+    timestamp INTEGER NOT NULL,
+    items BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_customer ON orders (customer_id, id);
+"""
+
+_COLUMNS = "id, customer_id, status, total, timestamp, items"
+
+def _order(row) -> Order:
+    order_id, customer_id, status, total, timestamp, items = row
+    order = Order.__new__(Order)
+    order.__setstate__((order_id, customer_id, items, total, status, timestamp, None))
+    return order
+
+class OrderArchive:
+    """Cold storage for completed and cancelled orders, in SQLite.
+
+    Orders are keyed by id with a secondary index on (customer_id, id), so lookups by
+    id and a customer's history are index seeks no matter how large the archive grows.
+    Writes are idempotent: archiving an order twice replaces the earlier row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+    def add_many(self, orders: Iterable[Order]):
+        with self.db:
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO orders ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                ((o.id, o.customer_id, o.status, o.total, o.timestamp, o.__getstate__()[2]) for o in orders)
+            )
+
+    def get(self, order_id: int) -> Optional[Order]:
+        row = self.db.execute(f"SELECT {_COLUMNS} FROM orders WHERE id = ?", (order_id,)).fetchone()
+        return _order(row) if row else None
+
+    def count(self, customer_id: Optional[int] = None) -> int:
+        if customer_id is None:
+            return self.db.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        return self.db.execute("SELECT COUNT(*) FROM orders WHERE customer_id = ?", (customer_id,)).fetchone()[0]
+
+    def customer_orders(self, customer_id: int, limit: int, offset: int = 0) -> List[Order]:
+        """A customer's archived orders, newest first"""
+        rows = self.db.execute(
+            f"SELECT {_COLUMNS} FROM orders WHERE customer_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+            (customer_id, limit, offset)
+        )
+        return [_order(row) for row in rows]
+
+    def iter_orders(self, batch_size: int = 1000) -> Iterator[Order]:
+        """Every archived order in id order, read in batches"""
+        last_id = 0
+        while True:
+            rows = self.db.execute(
+                f"SELECT {_COLUMNS} FROM orders WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _order(row)
+            last_id = rows[-1][0]
+
+    def sales_rows(self) -> Iterator[tuple]:
+        """(id, customer_id, total, timestamp, items) of every archived completed order, in id order.
+
+        ``items`` is the raw product id/quantity array, for bulk readers such as
+        database/analytics.py that skip building Order objects. Rows are read through a
+        connection of their own, so they can be consumed in a worker thread.
+        """
+        db = sqlite3.connect(self.path)
+        try:
+            yield from db.execute(
+                "SELECT id, customer_id, total, timestamp, items FROM orders WHERE status = 'completed' ORDER BY id"
+            )
+        finally:
+            db.close()
+
+    def close(self):
+        self.db.close()
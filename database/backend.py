@@ -0,0 +1,196 @@
+"""Shared storage behind a Store, for running several worker processes.
+
+A Store normally lives in one process and is persisted through its journal (see
+database/journal.py). With a backend attached, every mutating Store method runs as
+one backend transaction instead: the backend first brings the in-memory store up to
+date with changes made by other processes, the method runs, and the records it
+changed (``Store.drain_changes``) are written before the transaction commits. The
+in-memory store stays the read cache; ``sync`` refreshes it between transactions.
+"""
+import pickle
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from telegram.ext import PicklePersistence
+
+from database.archive import OrderArchive
+from database.store import Store
+
+class StoreBackend:
+    """Interface for shared stores; see SQLiteBackend"""
+
+    def load(self, fallback: Optional[Store] = None) -> Store:
+        """Build a Store from the backend and attach the backend to it.
+
+        ``fallback`` seeds an empty backend, e.g. with the store recovered from a journal.
+        """
+        raise NotImplementedError
+
+    def sync(self, store: Store) -> int:
+        """Apply changes written by other processes; returns how many were applied"""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self, store: Store) -> Iterator[None]:
+        """Run a store mutation atomically with respect to every other process"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    kind TEXT NOT NULL,
+    key INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    value BLOB,
+    PRIMARY KEY (kind, key)
+);
+CREATE INDEX IF NOT EXISTS records_by_seq ON records (seq);
+"""
+
+class SQLiteBackend(StoreBackend):
+    """Store records in one SQLite database in WAL mode, shared by every worker.
+
+    Each (kind, key) record holds the latest pickled value, or NULL once deleted, and
+    the sequence number of the write that produced it. A worker remembers the highest
+    sequence it has applied, so catching up is a single indexed range scan.
+
+    Transactions use BEGIN IMMEDIATE, which takes the database write lock up front:
+    only one process at a time can be inside a store mutation, so stock checks, order
+    ids and support assignments see every earlier write. Store methods never await,
+    so the lock is held for microseconds, not across network calls.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        # Autocommit mode: transactions are started explicitly below
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+        self.last_seq = 0
+        self._depth = 0
+
+    def is_empty(self) -> bool:
+        return self.db.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+    def load(self, fallback: Optional[Store] = None) -> Store:
+        store = Store()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            if fallback is not None and self.is_empty():
+                store = fallback
+                store.mark_all()
+                self._write(store)
+            else:
+                self.last_seq = 0
+                self._apply_changes(store)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        store._dirty.clear()
+        store.backend = self
+        return store
+
+    def _apply_changes(self, store: Store) -> int:
+        rows = self.db.execute(
+            "SELECT kind, key, seq, value FROM records WHERE seq > ? ORDER BY seq", (self.last_seq,)
+        ).fetchall()
+        for kind, key, seq, value in rows:
+            store.apply_record(kind, key, pickle.loads(value) if value is not None else None)
+            self.last_seq = seq
+        return len(rows)
+
+    def _write(self, store: Store):
+        records = store.drain_changes()
+        if not records:
+            return
+        seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM records").fetchone()[0]
+        rows = []
+        for kind, key, value in records:
+            seq += 1
+            rows.append((kind, key, seq, pickle.dumps(value, pickle.HIGHEST_PROTOCOL) if value is not None else None))
+        self.db.executemany("INSERT OR REPLACE INTO records (kind, key, seq, value) VALUES (?, ?, ?, ?)", rows)
+        self.last_seq = seq
+
+    def sync(self, store: Store) -> int:
+        if self._depth:
+            return 0
+        return self._apply_changes(store)
+
+    @contextmanager
+    def transaction(self, store: Store) -> Iterator[None]:
+        if self._depth:
+            # Store methods call each other; the outermost call owns the transaction
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        self.db.execute("BEGIN IMMEDIATE")
+        self._depth = 1
+        try:
+            self._apply_changes(store)
+            yield
+            self._write(store)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            self._restore(store)
+            raise
+        finally:
+            self._depth = 0
+
+    def _restore(self, store: Store):
+        # The failed method's in-memory changes were not written; put back the shared
+        # version of every record it touched
+        dirty = list(store._dirty)
+        store._dirty.clear()
+        for kind, key in dirty:
+            row = self.db.execute("SELECT value FROM records WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if row is not None and row[0] is not None:
+                store.apply_record(kind, key, pickle.loads(row[0]))
+            elif kind in ('product', 'customer', 'order'):
+                store.apply_record(kind, key, None)
+
+    def close(self):
+        self.db.close()
+
+class BackendPersistence(PicklePersistence):
+    """PicklePersistence for one worker process sharing its store through a backend.
+
+    ``bot_data['store']`` is loaded from the backend and never pickled; every change to
+    it is already committed by the time a handler returns. User data, chat data and
+    conversations stay in this worker's own pickle file.
+    """
+
+    def __init__(self, filepath, backend: StoreBackend, archive_path: Optional[str] = None, **kwargs):
+        super().__init__(filepath=filepath, **kwargs)
+        self.backend = backend
+        self.archive_path = archive_path
+        self.store: Optional[Store] = None
+
+    async def get_bot_data(self):
+        bot_data = await super().get_bot_data()
+        if self.store is None:
+            self.store = self.backend.load()
+            if self.archive_path:
+                self.store.attach_archive(OrderArchive(self.archive_path))
+        bot_data['store'] = self.store
+        return bot_data
+
+    async def update_bot_data(self, data) -> None:
+        await super().update_bot_data({key: value for key, value in data.items() if key != 'store'})
+
+    async def flush(self) -> None:
+        if self.bot_data is not None:
+            self.bot_data.pop('store', None)
+        await super().flush()
+        if self.store is not None and self.store.archive is not None:
+            self.store.archive.close()
+            self.store.attach_archive(None)
+        self.backend.close()
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+from telegram.ext import PicklePersistence
+
+from database.archive import OrderArchive
+from database.store import Store
+
+logger = logging.getLogger(__name__)
+
+# Each journal entry is one batch of store records: length, crc32, pickled list
+_HEADER = struct.Struct('>II')
+
+
+class StoreJournal:
+    """Append-only change log for a Store, compacted into a snapshot file.
+
+    Files on disk:
+        <path>_store               pickled Store snapshot
+        <path>_journal.<seq>       journal segments, replayed in sequence order
+
+    Only the highest segment is written to. When it grows past ``segment_size`` it is
+    sealed and a new one is started; sealed segments are folded into the snapshot by
+    ``compact`` without touching the live store, so it can safely run in a thread.
+
+    Each entry is fsynced before ``commit`` returns, in a worker thread so the event
+    loop keeps serving updates meanwhile. With ``fsync=False`` entries are only flushed
+    to the OS: a crash of the process loses nothing, but a power loss or kernel crash
+    can lose the last few seconds of changes.
+    """
+
+    def __init__(self, filepath, segment_size: int = 4 * 1024 * 1024, fsync: bool = True):
+        self.filepath = Path(filepath)
+        self.snapshot_path = Path(f"{self.filepath}_store")
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.segment_seq = 0
+        self._segment = None
+        self._compaction: Optional[asyncio.Task] = None
+        self._writing = asyncio.Lock()  # keeps rotate and close from closing a segment being synced
+
+    def _segment_path(self, seq: int) -> Path:
+        return Path(f"{self.filepath}_journal.{seq:08d}")
+
+    def _segments(self) -> List[int]:
+        prefix = f"{self.filepath.name}_journal."
+        seqs = []
+        for path in self.filepath.parent.glob(f"{prefix}*"):
+            suffix = path.name[len(prefix):]
+            if suffix.isdigit():
+                seqs.append(int(suffix))
+        return sorted(seqs)
+
+    @staticmethod
+    def _read_segment(path: Path) -> List[tuple]:
+        records = []
+        with path.open('rb') as file:
+            while True:
+                header = file.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                length, crc = _HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Torn write from a crash; everything before it is intact
+                    logger.warning("Ignoring truncated journal entry in %s", path.name)
+                    break
+                records.extend(pickle.loads(payload))
+        return records
+
+    def _load_snapshot(self) -> Optional[Store]:
+        if not self.snapshot_path.exists():
+            return None
+        with self.snapshot_path.open('rb') as file:
+            return pickle.load(file)
+
+    def _write_snapshot(self, store: Store) -> None:
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + '.tmp')
+        with tmp_path.open('wb') as file:
+            pickle.dump(store, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def load(self, fallback: Optional[Store] = None) -> Store:
+        """Recover the store from the snapshot plus every journal segment.
+
+        ``fallback`` is used when no snapshot exists yet, e.g. a store found in a
+        bot_data pickle written before the journal was introduced.
+        """
+        store = self._load_snapshot()
+        if store is None:
+            store = fallback if fallback is not None else Store()
+            self._write_snapshot(store)
+
+        seqs = self._segments()
+        for seq in seqs:
+            for record in self._read_segment(self._segment_path(seq)):
+                store.apply_record(*record)
+        store._dirty.clear()
+
+        self.segment_seq = seqs[-1] + 1 if seqs else 0
+        self._segment = self._segment_path(self.segment_seq).open('ab')
+        return store
+
+    def append(self, store: Store, sync: bool = True) -> int:
+        """Write every pending store change as one journal entry; returns the record count"""
+        records = store.drain_changes()
+        if not records:
+            return 0
+        if self._segment is None:
+            # Changes made after close() still reach the journal; the segment is closed
+            # again by the next close()
+            self._segment = self._segment_path(self.segment_seq).open('ab')
+        payload = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+        self._segment.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._segment.flush()
+        if sync and self.fsync:
+            os.fsync(self._segment.fileno())
+        return len(records)
+
+    async def commit(self, store: Store) -> int:
+        """``append`` with the fsync run in a worker thread, then compact if the segment is full"""
+        async with self._writing:
+            count = self.append(store, sync=False)
+            if count and self.fsync:
+                await asyncio.to_thread(os.fsync, self._segment.fileno())
+            if self.needs_compaction():
+                self.schedule_compaction()
+        return count
+
+    def needs_compaction(self) -> bool:
+        return self._segment.tell() >= self.segment_size
+
+    def rotate(self) -> int:
+        """Seal the current segment and start a new one; returns the sealed sequence"""
+        sealed = self.segment_seq
+        self._segment.close()
+        self.segment_seq += 1
+        self._segment = self._segment_path(self.segment_seq).open('ab')
+        return sealed
+
+    def compact(self, up_to: int) -> None:
+        """Fold every segment up to and including ``up_to`` into the snapshot"""
+        store = self._load_snapshot() or Store()
+        seqs = [seq for seq in self._segments() if seq <= up_to]
+        for seq in seqs:
+            for record in self._read_segment(self._segment_path(seq)):
+                store.apply_record(*record)
+        self._write_snapshot(store)
+        for seq in seqs:
+            self._segment_path(seq).unlink()
+        logger.info("Compacted %d journal segment(s) into %s", len(seqs), self.snapshot_path.name)
+
+    def schedule_compaction(self) -> None:
+        """Rotate and compact in a worker thread unless a compaction is already running"""
+        if self._compaction is not None and not self._compaction.done():
+            return
+        sealed = self.rotate()
+        self._compaction = asyncio.create_task(asyncio.to_thread(self.compact, sealed))
+
+    async def close(self) -> None:
+        if self._compaction is not None:
+            await self._compaction
+        async with self._writing:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+
+class JournalPersistence(PicklePersistence):
+    """PicklePersistence that keeps ``bot_data['store']`` in a StoreJournal.
+
+    Archived orders live in ``<path>_archive.sqlite`` (see database/archive.py).
+    Everything else in bot_data, user_data, chat_data and conversations is pickled as
+    before. The store itself is never re-pickled on flush: only the records changed since
+    the previous flush are appended to the journal, so flush cost follows the amount of
+    change instead of the size of the store. ``fsync`` is passed on to the journal.
+    """
+
+    def __init__(self, filepath, segment_size: int = 4 * 1024 * 1024, fsync: bool = True, **kwargs):
+        super().__init__(filepath=filepath, **kwargs)
+        self.journal = StoreJournal(filepath, segment_size=segment_size, fsync=fsync)
+        self.archive_path = f"{filepath}_archive.sqlite"
+        self.store: Optional[Store] = None
+
+    async def get_bot_data(self):
+        bot_data = await super().get_bot_data()
+        if self.store is None:
+            # Stores pickled into bot_data by plain PicklePersistence are migrated here
+            self.store = self.journal.load(fallback=bot_data.get('store'))
+            self.store.attach_archive(OrderArchive(self.archive_path))
+        bot_data['store'] = self.store
+        return bot_data
+
+    async def update_bot_data(self, data) -> None:
+        data = {key: value for key, value in data.items() if key != 'store'}
+        await super().update_bot_data(data)
+        if self.store is not None:
+            await self.journal.commit(self.store)
+
+    async def flush(self) -> None:
+        if self.bot_data is not None:
+            self.bot_data.pop('store', None)
+        await super().flush()
+        if self.store is not None:
+            await self.journal.commit(self.store)
+            if self.store.archive is not None:
+                self.store.archive.close()
+                self.store.attach_archive(None)
+        await self.journal.close()
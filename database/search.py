@@ -0,0 +1,90 @@
+import bisect
+import heapq
+import re
+from typing import Dict, List, Set, Tuple
+
+_TOKEN = re.compile(r"\w+")
+
+# Score contributed by a token appearing in each field
+NAME_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+# Prefix matches score less than whole-word matches
+PREFIX_FACTOR = 0.5
+# Cap on how many index terms one query prefix may expand to
+MAX_PREFIX_EXPANSION = 64
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+class ProductSearchIndex:
+    """Inverted index over product names and descriptions.
+
+    ``postings`` maps each token to {product_id: weight}; ``terms`` is the sorted list of
+    tokens, so all tokens sharing a prefix form one contiguous bisectable slice.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.terms: List[str] = []
+        self.documents: Dict[int, Set[str]] = {}  # product_id: its tokens, for removal
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, product_id: int, name: str, description: str):
+        self.remove(product_id)
+        weights: Dict[str, float] = {}
+        for token in tokenize(description):
+            weights[token] = weights.get(token, 0.0) + DESCRIPTION_WEIGHT
+        for token in tokenize(name):
+            weights[token] = weights.get(token, 0.0) + NAME_WEIGHT
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                bisect.insort(self.terms, token)
+            posting[product_id] = weight
+        self.documents[product_id] = set(weights)
+
+    def remove(self, product_id: int):
+        for token in self.documents.pop(product_id, ()):
+            posting = self.postings[token]
+            del posting[product_id]
+            if not posting:
+                del self.postings[token]
+                del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff', start)
+        return self.terms[start:min(end, start + MAX_PREFIX_EXPANSION)]
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        scores: Dict[int, float] = dict(self.postings.get(term, {}))
+        for token in self._expand(term):
+            if token == term:
+                continue
+            for product_id, weight in self.postings[token].items():
+                prefix_score = weight * PREFIX_FACTOR
+                if scores.get(product_id, 0.0) < prefix_score:
+                    scores[product_id] = prefix_score
+        return scores
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Return up to ``limit`` (product_id, score) pairs matching every query term.
+
+        Each term matches whole tokens and, with a lower score, tokens it is a prefix of.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        per_term = sorted((self._term_scores(term) for term in terms), key=len)
+        if not per_term[0]:
+            return []
+        # Intersect starting from the rarest term
+        results = dict(per_term[0])
+        for scores in per_term[1:]:
+            results = {pid: score + scores[pid] for pid, score in results.items() if pid in scores}
+            if not results:
+                return []
+        return heapq.nlargest(limit, results.items(), key=lambda item: (item[1], -item[0]))
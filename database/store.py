@@ -1,76 +1,600 @@
-from dataclasses import dataclass
-from typing import Dict, List
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
+from array import array
+import bisect
+import functools
+import heapq
+import time
+import itertools
+from database.search import ProductSearchIndex
+from database.support import SupportQueue
 
-@dataclass
-class Product:
+class _Compact:
+    """Pickling for the slotted records below.
+
+    Instances pickle as a bare tuple of field values, without attribute names. Pickles
+    written before the records were slotted carry the instance ``__dict__`` instead;
+    those are still accepted, with later-added fields taking their defaults.
+    """
+    __slots__ = ()
+    _DEFAULTS: Dict[str, object] = {}
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        fields = self.__slots__
+        if isinstance(state, dict):
+            values = self._legacy_values(state)
+        else:
+            values = list(state) + [self._DEFAULTS.get(name) for name in fields[len(state):]]
+        for name, value in zip(fields, values):
+            object.__setattr__(self, name, value)
+
+    def _legacy_values(self, state: dict) -> list:
+        return [state.get(name, self._DEFAULTS.get(name)) for name in self.__slots__]
+
+@dataclass(slots=True)
+class Product(_Compact):
     id: int
     name: str
     description: str
     price: float
     stock: int
     image_url: str
+    photo_file_id: Optional[str] = None  # Telegram file_id of the uploaded image, reused on later sends
+    low_stock_alerted: bool = False  # admins were told the stock is low; cleared once it is back above the threshold
+    # Customer ids to tell when the product is back in stock; a dict used as an ordered set
+    restock_subscribers: Dict[int, None] = field(default_factory=dict)
 
-@dataclass
-class Customer:
+    _DEFAULTS = {'photo_file_id': None, 'low_stock_alerted': False, 'restock_subscribers': ()}
+
+    def __setstate__(self, state):
+        _Compact.__setstate__(self, state)
+        # Older pickles have no subscribers or keep them in a tuple
+        if not isinstance(self.restock_subscribers, dict):
+            self.restock_subscribers = dict.fromkeys(self.restock_subscribers)
+
+@dataclass(slots=True)
+class Customer(_Compact):
     id: int
     username: str
     cart: Dict[int, int]  # product_id: quantity
     total_spent: float
+    cart_updated: Optional[float] = None  # epoch seconds of the last cart change, None when empty
+    cart_reminded: bool = False  # an abandoned-cart reminder was sent for the current cart
+
+    _DEFAULTS = {'cart_updated': None, 'cart_reminded': False}
+
+class Order(_Compact):
+    """A placed order.
+
+    Line items are packed into one array of alternating product ids and quantities and
+    the date is kept as integer epoch seconds; ``products`` and ``date`` rebuild the
+    dict and datetime on access.
+    """
+    # reserved_until is the epoch time the order's stock is held until, or None
+    __slots__ = ('id', 'customer_id', '_items', 'total', 'status', '_date', 'reserved_until')
+
+    def __init__(self, id: int, customer_id: int, products: Dict[int, int], total: float, status: str,
+                 date: datetime, reserved_until: Optional[float] = None):
+        self.id = id
+        self.customer_id = customer_id
+        self.products = products
+        self.total = total
+        self.status = status
+        self.date = date
+        self.reserved_until = reserved_until
+
+    @property
+    def products(self) -> Dict[int, int]:
+        """product_id: quantity"""
+        return dict(self.line_items())
+
+    @products.setter
+    def products(self, products: Dict[int, int]):
+        self._items = array('q', itertools.chain.from_iterable(products.items()))
+
+    def line_items(self) -> Iterator[Tuple[int, int]]:
+        """(product_id, quantity) pairs, without building a dict"""
+        items = self._items
+        return zip(items[::2], items[1::2])
+
+    @property
+    def date(self) -> datetime:
+        return datetime.fromtimestamp(self._date)
+
+    @date.setter
+    def date(self, date: datetime):
+        self._date = int(date.timestamp())
+
+    @property
+    def timestamp(self) -> int:
+        return self._date
+
+    def __getstate__(self):
+        return (self.id, self.customer_id, self._items.tobytes(), self.total, self.status, self._date,
+                self.reserved_until)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict) or len(state) != len(self.__slots__):
+            _Compact.__setstate__(self, state)
+            if isinstance(self._items, bytes):
+                self._items = array('q', self._items)
+            return
+        # Hot path when loading a large store, so unpacked directly
+        self.id, self.customer_id, items, self.total, self.status, self._date, self.reserved_until = state
+        self._items = array('q')
+        self._items.frombytes(items)
+
+    def _legacy_values(self, state: dict) -> list:
+        # Dataclass pickles hold a products dict and a datetime
+        return [state['id'], state['customer_id'],
+                array('q', itertools.chain.from_iterable(state['products'].items())),
+                state['total'], state['status'], int(state['date'].timestamp()), state.get('reserved_until')]
+
+    def __eq__(self, other):
+        if not isinstance(other, Order):
+            return NotImplemented
+        return self.__getstate__() == other.__getstate__()
+
+    def __repr__(self):
+        return (f"Order(id={self.id!r}, customer_id={self.customer_id!r}, products={self.products!r}, "
+                f"total={self.total!r}, status={self.status!r}, date={self.date!r}, "
+                f"reserved_until={self.reserved_until!r})")
 
 @dataclass
-class Order:
-    id: int
-    customer_id: int
-    products: Dict[int, int]  # product_id: quantity
-    total: float
-    status: str
-    date: datetime
+class RevenueStats:
+    """Running revenue totals plus hourly and daily rollups of completed orders"""
+    total_revenue: float = 0.0
+    total_orders: int = 0
+    hourly: Dict[int, List[float]] = field(default_factory=dict)  # hours since epoch: [revenue, orders]
+    daily: Dict[int, List[float]] = field(default_factory=dict)  # days since epoch: [revenue, orders]
+
+    HOURLY_RETENTION = 48
+    DAILY_RETENTION = 400
+
+    def record(self, amount: float, when: datetime):
+        self.total_revenue += amount
+        self.total_orders += 1
+        hour = int(when.timestamp() // 3600)
+        self._add(self.hourly, hour, amount, self.HOURLY_RETENTION)
+        self._add(self.daily, hour // 24, amount, self.DAILY_RETENTION)
+
+    @staticmethod
+    def _add(buckets: Dict[int, List[float]], key: int, amount: float, retention: int):
+        latest = max(key, next(reversed(buckets), key))
+        if key <= latest - retention:
+            return
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = [0.0, 0]
+        bucket[0] += amount
+        bucket[1] += 1
+        # Buckets are created in (roughly) chronological order, so expired ones are at the front
+        while buckets and next(iter(buckets)) <= latest - retention:
+            del buckets[next(iter(buckets))]
+
+    def window(self, hours: int, now: Optional[datetime] = None) -> Tuple[float, int]:
+        """Revenue and order count for the last ``hours`` hours.
+
+        Windows up to a day use hourly buckets; longer ones use whole UTC days,
+        today included.
+        """
+        hour = int((now or datetime.now()).timestamp() // 3600)
+        if hours <= 24:
+            keys = range(hour - hours + 1, hour + 1)
+            buckets = self.hourly
+        else:
+            day = hour // 24
+            keys = range(day - hours // 24 + 1, day + 1)
+            buckets = self.daily
+        revenue, orders = 0.0, 0
+        for key in keys:
+            bucket = buckets.get(key)
+            if bucket is not None:
+                revenue += bucket[0]
+                orders += bucket[1]
+        return revenue, int(orders)
+
+class _DueHeap:
+    """Min-heap of (time, key) holding at most one entry per key.
+
+    ``schedule`` ignores keys that are already queued, however often they change. When
+    an entry comes due, ``pop_due`` asks for the key's current time: an entry whose
+    key has moved on is pushed back at its new time, and one whose key is gone is
+    dropped. Popping costs time in proportion to the entries that came due.
+    """
+
+    def __init__(self):
+        self.heap: List[Tuple[float, int]] = []
+        self.queued: Set[int] = set()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, when: float, key: int):
+        if key not in self.queued:
+            self.queued.add(key)
+            heapq.heappush(self.heap, (when, key))
+
+    def pop_due(self, before: float, current_time) -> Iterator[int]:
+        """Yield keys whose current time, ``current_time(key)`` or None if gone, is before ``before``"""
+        heap = self.heap
+        while heap and heap[0][0] < before:
+            when, key = heapq.heappop(heap)
+            now_when = current_time(key)
+            if now_when is not None and now_when > when:
+                heapq.heappush(heap, (now_when, key))
+                continue
+            self.queued.discard(key)
+            if now_when is not None:
+                yield key
+
+# Statuses an order never leaves, so it can move to the archive once old enough
+ARCHIVED_STATUSES = ("completed", "cancelled")
+
+def _atomic(method):
+    """Run a mutating Store method as one transaction of the attached backend, if any"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.backend is None:
+            return method(self, *args, **kwargs)
+        with self.backend.transaction(self):
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class Store:
     def __init__(self):
         self.products: Dict[int, Product] = {}
         self.customers: Dict[int, Customer] = {}
         self.orders: List[Order] = []
-        self.support_queue: List[int] = []  # List of user_ids waiting for support
+        self.support_queue = SupportQueue()  # user_ids waiting for support, in order
         self.active_support_sessions: Dict[int, int] = {}  # user_id: admin_id
         self.next_product_id = 1
         self.next_order_id = 1
+        self.revenue = RevenueStats()
+        self._dirty: Set[Tuple[str, int]] = set()  # (kind, key) changed since last journal flush
+        self.archive = None  # OrderArchive holding finished orders moved out of `orders`
+        self.backend = None  # StoreBackend shared with other processes (database/backend.py)
+        self._rebuild_indexes()
+
+    # Attributes derived from the ones above; never pickled, rebuilt on load
+    _TRANSIENT = ('_dirty', 'orders_by_id', 'pending_orders', 'customer_orders', 'search_index', 'reserved', '_reservation_heap',
+                  'admin_sessions', '_support_cursor', 'archive',
+                  'product_versions', 'customer_versions', 'backend', 'completion_log',
+                  '_cart_expiry', '_cart_reminders', '_pending_heap', '_archive_heap',
+                  'catalog', 'stock_index', '_indexed_stock', '_alert_threshold', '_low_stock_due', '_low_stock_rearm',
+                  '_restock_due')
+
+    # How long stock stays held for an unpaid order
+    RESERVATION_TTL = 15 * 60
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self._TRANSIENT:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.support_queue, list):
+            # Store pickled when the queue was a plain list
+            self.support_queue = SupportQueue(self.support_queue)
+        self._dirty = set()
+        self.archive = None
+        self.backend = None
+        self._rebuild_indexes()
+        if 'revenue' not in state:
+            # Store pickled before revenue rollups existed
+            self.rebuild_revenue_stats()
+
+    def _rebuild_indexes(self):
+        self.orders_by_id: Dict[int, Order] = {}
+        self.pending_orders: Dict[int, Dict[int, Order]] = {}  # customer_id: {order_id: order}
+        self.customer_orders: Dict[int, List[int]] = {}  # customer_id: ids of their in-memory orders, ascending
+        # Bumped on every change, so rendered views can tell when they are stale
+        self.product_versions: Dict[int, int] = {}
+        self.customer_versions: Dict[int, int] = {}
+        self.reserved: Dict[int, int] = {}  # product_id: quantity held by pending orders
+        self._reservation_heap: List[Tuple[float, int]] = []  # (reserved_until, order_id)
+        # Ids of in-memory orders in the order they were completed; append-only, so
+        # readers such as database/analytics.py keep their own position in it
+        self.completion_log = array('q')
+        # Due times for the maintenance sweeps (handlers/maintenance.py)
+        self._cart_expiry = _DueHeap()  # customer_ids with a cart, by cart_updated
+        self._cart_reminders = _DueHeap()  # customer_ids with a cart not reminded about yet
+        # (order timestamp, order_id); like the reservation heap, entries of orders that
+        # are no longer pending are skipped when popped
+        self._pending_heap: List[Tuple[int, int]] = []
+        # (order timestamp, order_id) of in-memory orders that can be archived; entries of
+        # orders archived by another process are skipped when popped
+        self._archive_heap: List[Tuple[int, int]] = []
+        for order in self.orders:
+            self._index_order(order)
+            self._hold(order)
+            if order.status == "completed":
+                self.completion_log.append(order.id)
+            elif order.status == "pending":
+                self._pending_heap.append((order.timestamp, order.id))
+            if order.status in ARCHIVED_STATUSES:
+                self._archive_heap.append((order.timestamp, order.id))
+        heapq.heapify(self._pending_heap)
+        heapq.heapify(self._archive_heap)
+        for customer in self.customers.values():
+            self._schedule_cart(customer)
+        self.search_index = ProductSearchIndex()
+        for product in self.products.values():
+            self.search_index.add(product.id, product.name, product.description)
+        # Product ids in catalog order (by id), so a page is one slice
+        self.catalog: List[int] = sorted(self.products)
+        # (stock, product_id) of every product, ascending; kept current by _index_product
+        self.stock_index: List[Tuple[int, int]] = sorted((product.stock, product.id) for product in self.products.values())
+        self._indexed_stock: Dict[int, int] = {product_id: stock for stock, product_id in self.stock_index}
+        # Set up by the first take_low_stock_alerts: products at or below the threshold not
+        # alerted yet, and alerted products back above it whose flag is to be cleared
+        self._alert_threshold: Optional[int] = None
+        self._low_stock_due: Set[int] = set()
+        self._low_stock_rearm: Set[int] = set()
+        # Products back in stock with customers waiting to hear about it
+        self._restock_due: Set[int] = {product.id for product in self.products.values()
+                                       if product.restock_subscribers and product.stock > 0}
+        self._index_support_sessions()
+        self._support_cursor = 0  # next admin to try for round-robin assignment
+
+    def _schedule_cart(self, customer: Customer):
+        if not customer.cart:
+            return
+        if customer.cart_updated is None:
+            # Carts from before cart times were kept count as changed now
+            customer.cart_updated = time.time()
+        self._cart_expiry.schedule(customer.cart_updated, customer.id)
+        if not customer.cart_reminded:
+            self._cart_reminders.schedule(customer.cart_updated, customer.id)
+
+    def _cart_changed(self, customer: Customer):
+        """Restart the expiry and reminder clocks of a customer's cart"""
+        customer.cart_updated = time.time() if customer.cart else None
+        customer.cart_reminded = False
+        self._schedule_cart(customer)
+        self._customer_changed(customer.id)
+
+    def _index_support_sessions(self):
+        self.admin_sessions: Dict[int, Set[int]] = {}  # admin_id: user_ids they are serving
+        for user_id, admin_id in self.active_support_sessions.items():
+            self.admin_sessions.setdefault(admin_id, set()).add(user_id)
+
+    def _index_order(self, order: Order):
+        self.orders_by_id[order.id] = order
+        order_ids = self.customer_orders.get(order.customer_id)
+        if order_ids is None:
+            self.customer_orders[order.customer_id] = [order.id]
+        elif order_ids[-1] < order.id:
+            order_ids.append(order.id)
+        else:
+            index = bisect.bisect_left(order_ids, order.id)
+            if index == len(order_ids) or order_ids[index] != order.id:
+                order_ids.insert(index, order.id)
+        pending = self.pending_orders.get(order.customer_id)
+        if order.status == "pending":
+            if pending is None:
+                pending = self.pending_orders[order.customer_id] = {}
+            pending[order.id] = order
+        elif pending is not None:
+            pending.pop(order.id, None)
+            if not pending:
+                del self.pending_orders[order.customer_id]
+
+    def __deepcopy__(self, memo):
+        # The store is persisted through its journal (see database/journal.py), so the
+        # deepcopy the application makes of bot_data before every flush must not copy it.
+        return self
+
+    def _mark(self, kind: str, key: int = 0):
+        self._dirty.add((kind, key))
+
+    def _product_changed(self, product_id: int):
+        self.product_versions[product_id] = self.product_versions.get(product_id, 0) + 1
+        self._index_product(product_id)
+        self._mark('product', product_id)
+
+    def _index_product(self, product_id: int):
+        """Bring the catalog, the stock index and the alert and restock sets up to date with one product"""
+        product = self.products.get(product_id)
+        stock = product.stock if product is not None else None
+        indexed = self._indexed_stock.get(product_id)
+        if indexed != stock:
+            if indexed is not None:
+                del self.stock_index[bisect.bisect_left(self.stock_index, (indexed, product_id))]
+                del self._indexed_stock[product_id]
+                if stock is None:
+                    del self.catalog[bisect.bisect_left(self.catalog, product_id)]
+            if stock is not None:
+                bisect.insort(self.stock_index, (stock, product_id))
+                self._indexed_stock[product_id] = stock
+                if indexed is None:
+                    bisect.insort(self.catalog, product_id)
+        if self._alert_threshold is not None:
+            low = product is not None and product.stock <= self._alert_threshold
+            if low and not product.low_stock_alerted:
+                self._low_stock_due.add(product_id)
+            else:
+                self._low_stock_due.discard(product_id)
+            if product is not None and product.low_stock_alerted and not low:
+                self._low_stock_rearm.add(product_id)
+            else:
+                self._low_stock_rearm.discard(product_id)
+        if product is not None and product.restock_subscribers and product.stock > 0:
+            self._restock_due.add(product_id)
+        else:
+            self._restock_due.discard(product_id)
+
+    def _customer_changed(self, customer_id: int):
+        self.customer_versions[customer_id] = self.customer_versions.get(customer_id, 0) + 1
+        self._mark('customer', customer_id)
+
+    def mark_all(self):
+        """Mark every record as changed, so the next drain_changes exports the whole store"""
+        for product_id in self.products:
+            self._mark('product', product_id)
+        for customer_id in self.customers:
+            self._mark('customer', customer_id)
+        for order in self.orders:
+            self._mark('order', order.id)
+        self._mark('state')
+        self._mark('revenue')
+
+    def drain_changes(self) -> List[tuple]:
+        """Return (kind, key, value) records for everything changed since the last call"""
+        records = []
+        for kind, key in sorted(self._dirty):
+            if kind == 'product':
+                records.append((kind, key, self.products.get(key)))
+            elif kind == 'customer':
+                records.append((kind, key, self.customers.get(key)))
+            elif kind == 'order':
+                records.append((kind, key, self.orders_by_id.get(key)))
+            elif kind == 'state':
+                records.append((kind, key, {
+                    'support_queue': list(self.support_queue),
+                    'active_support_sessions': dict(self.active_support_sessions),
+                    'next_product_id': self.next_product_id,
+                    'next_order_id': self.next_order_id,
+                }))
+            elif kind == 'revenue':
+                records.append((kind, key, self.revenue))
+        self._dirty.clear()
+        return records
 
+    def apply_record(self, kind: str, key: int, value) -> None:
+        """Replay a record produced by drain_changes"""
+        if kind == 'product':
+            self.product_versions[key] = self.product_versions.get(key, 0) + 1
+            if value is None:
+                self.products.pop(key, None)
+                self.search_index.remove(key)
+            else:
+                self.products[key] = value
+                self.search_index.add(key, value.name, value.description)
+            self._index_product(key)
+        elif kind == 'customer':
+            self.customer_versions[key] = self.customer_versions.get(key, 0) + 1
+            if value is None:
+                self.customers.pop(key, None)
+            else:
+                self.customers[key] = value
+                self._schedule_cart(value)
+        elif kind == 'order':
+            if value is None:
+                # Moved to the archive
+                self._remove_orders({key})
+                return
+            previous = self.orders_by_id.get(key)
+            if value.status == "completed" and (previous is None or previous.status != "completed"):
+                self.completion_log.append(key)
+            elif value.status == "pending" and previous is None:
+                heapq.heappush(self._pending_heap, (value.timestamp, key))
+            if value.status in ARCHIVED_STATUSES and (previous is None or previous.status not in ARCHIVED_STATUSES):
+                heapq.heappush(self._archive_heap, (value.timestamp, key))
+            if previous is not None:
+                self._unhold(previous)
+                # Orders are appended in id order, so the list stays sorted by id
+                index = bisect.bisect_left(self.orders, key, key=lambda o: o.id)
+                self.orders[index] = value
+            elif not self.orders or self.orders[-1].id < key:
+                self.orders.append(value)
+            else:
+                self.orders.insert(bisect.bisect_left(self.orders, key, key=lambda o: o.id), value)
+            self._index_order(value)
+            self._hold(value)
+        elif kind == 'state':
+            self.support_queue = SupportQueue(value['support_queue'])
+            self.active_support_sessions = value['active_support_sessions']
+            self._index_support_sessions()
+            self.next_product_id = value['next_product_id']
+            self.next_order_id = value['next_order_id']
+        elif kind == 'revenue':
+            self.revenue = value
+
+    @_atomic
     def add_product(self, name: str, description: str, price: float, stock: int, image_url: str) -> Product:
         product = Product(self.next_product_id, name, description, price, stock, image_url)
         self.products[product.id] = product
+        self.search_index.add(product.id, name, description)
         self.next_product_id += 1
+        self._product_changed(product.id)
+        self._mark('state')
         return product
 
     def get_product(self, product_id: int) -> Product:
         return self.products.get(product_id)
 
+    @_atomic
     def update_product(self, product_id: int, **kwargs) -> bool:
         if product_id in self.products:
             product = self.products[product_id]
             for key, value in kwargs.items():
                 setattr(product, key, value)
+            if 'image_url' in kwargs and 'photo_file_id' not in kwargs:
+                product.photo_file_id = None
+            if 'name' in kwargs or 'description' in kwargs:
+                self.search_index.add(product_id, product.name, product.description)
+            self._product_changed(product_id)
             return True
         return False
 
+    def get_products_page(self, page: int, page_size: int) -> List[Product]:
+        """One page of the catalog; costs time in proportion to the page, not the catalog"""
+        start = page * page_size
+        return [self.products[product_id] for product_id in self.catalog[start:start + page_size]]
+
+    def low_stock_products(self, threshold: int, limit: Optional[int] = None) -> List[Product]:
+        """Products with at most ``threshold`` in stock, lowest first"""
+        end = bisect.bisect_right(self.stock_index, (threshold, float('inf')))
+        if limit is not None:
+            end = min(end, limit)
+        return [self.products[product_id] for _, product_id in self.stock_index[:end]]
+
+    def sold_out_count(self) -> int:
+        return bisect.bisect_right(self.stock_index, (0, float('inf')))
+
+    def search_products(self, query: str, limit: int = 10) -> List[Product]:
+        """Products matching every term of the query, best match first"""
+        return [self.products[pid] for pid, _ in self.search_index.search(query, limit)]
+
+    @_atomic
+    def set_product_file_id(self, product_id: int, file_id: str) -> None:
+        product = self.products.get(product_id)
+        if product is not None and product.photo_file_id != file_id:
+            product.photo_file_id = file_id
+            self._product_changed(product_id)
+
+    @_atomic
     def delete_product(self, product_id: int) -> bool:
         if product_id in self.products:
             del self.products[product_id]
+            self.search_index.remove(product_id)
+            self._product_changed(product_id)
             return True
         return False
 
+    @_atomic
     def add_to_cart(self, customer_id: int, product_id: int, quantity: int) -> bool:
         if customer_id not in self.customers:
             self.customers[customer_id] = Customer(customer_id, "", {}, 0.0)
         
-        if product_id in self.products and self.products[product_id].stock >= quantity:
-            customer = self.customers[customer_id]
-            current_quantity = customer.cart.get(product_id, 0)
+        customer = self.customers[customer_id]
+        current_quantity = customer.cart.get(product_id, 0)
+        # Expired holds must not block the cart, even without the maintenance job
+        self.release_expired_reservations()
+        if product_id in self.products and self.available_stock(product_id) >= current_quantity + quantity:
             customer.cart[product_id] = current_quantity + quantity
+            self._cart_changed(customer)
             return True
         return False
 
+    @_atomic
     def create_order(self, customer_id: int) -> Order:
         if customer_id not in self.customers:
             return None
@@ -79,43 +603,464 @@ class Store:
         if not customer.cart:
             return None
         
+        # Check and hold stock for every item in one synchronous step, so concurrently
+        # processed updates can never both take the last unit
+        self.release_expired_reservations()
+        for pid, qty in customer.cart.items():
+            if pid not in self.products or self.available_stock(pid) < qty:
+                return None
+        
         total = sum(self.products[pid].price * qty for pid, qty in customer.cart.items())
-        order = Order(self.next_order_id, customer_id, customer.cart.copy(), total, "pending", datetime.now())
+        order = Order(self.next_order_id, customer_id, customer.cart.copy(), total, "pending", datetime.now(),
+                      reserved_until=time.time() + self.RESERVATION_TTL)
         self.orders.append(order)
+        self._index_order(order)
+        self._hold(order)
+        heapq.heappush(self._pending_heap, (order.timestamp, order.id))
         self.next_order_id += 1
         
         # Clear cart after order creation
         customer.cart = {}
+        self._cart_changed(customer)
+        self._mark('order', order.id)
+        self._mark('state')
         
         return order
 
+    def get_order(self, order_id: int) -> Optional[Order]:
+        order = self.orders_by_id.get(order_id)
+        if order is None and self.archive is not None:
+            order = self.archive.get(order_id)
+        return order
+
+    def get_customer_orders(self, customer_id: int, limit: int, offset: int = 0) -> List[Order]:
+        """A customer's orders, newest first, including archived ones"""
+        order_ids = self.customer_orders.get(customer_id, [])
+        hot = [self.orders_by_id[order_id] for order_id in reversed(order_ids[-(offset + limit):])]
+        if self.archive is None:
+            return hot[offset:offset + limit]
+        archived = self.archive.customer_orders(customer_id, offset + limit)
+        merged = []
+        seen = set()
+        for order in heapq.merge(hot, archived, key=lambda o: -o.id):
+            # An order can briefly be in both if the process stopped mid-archive
+            if order.id not in seen:
+                seen.add(order.id)
+                merged.append(order)
+        return merged[offset:offset + limit]
+
+    def count_customer_orders(self, customer_id: int) -> int:
+        count = len(self.customer_orders.get(customer_id, ()))
+        if self.archive is not None:
+            count += self.archive.count(customer_id)
+        return count
+
+    def attach_archive(self, archive) -> None:
+        self.archive = archive
+
+    def _remove_orders(self, order_ids: Set[int]):
+        for order_id in order_ids:
+            order = self.orders_by_id.pop(order_id, None)
+            if order is not None:
+                self._unhold(order)
+                pending = self.pending_orders.get(order.customer_id)
+                if pending is not None:
+                    pending.pop(order_id, None)
+                    if not pending:
+                        del self.pending_orders[order.customer_id]
+                customer_order_ids = self.customer_orders.get(order.customer_id)
+                if customer_order_ids is not None:
+                    customer_order_ids.remove(order_id)
+                    if not customer_order_ids:
+                        del self.customer_orders[order.customer_id]
+        self._drop_from_order_list(order_ids)
+
+    def _drop_from_order_list(self, order_ids: Set[int]):
+        """Remove orders from ``orders`` in place, one ``del`` per run of neighbouring ones.
+
+        The list is sorted by id; the first order is found by bisection and the rest by
+        walking on from it. Archived orders are the oldest, so they usually form a few
+        long runs near the front and the cost follows the number removed, not the list.
+        """
+        orders = self.orders
+        ids = sorted(order_ids)
+        index = bisect.bisect_left(orders, ids[0], key=lambda o: o.id) if ids else 0
+        runs: List[List[int]] = []  # [start, end) of runs to delete
+        for order_id in ids:
+            while index < len(orders) and orders[index].id < order_id:
+                index += 1
+            if index == len(orders):
+                break
+            if orders[index].id == order_id:
+                if runs and runs[-1][1] == index:
+                    runs[-1][1] = index + 1
+                else:
+                    runs.append([index, index + 1])
+                index += 1
+        for start, end in reversed(runs):
+            del orders[start:end]
+
+    @_atomic
+    def archive_orders(self, before: datetime, limit: int = 1000) -> int:
+        """Move up to ``limit`` completed or cancelled orders dated before ``before`` into the archive.
+
+        The archive is written first, so a crash in between leaves an order in both
+        places rather than in neither. Returns how many orders were moved. Candidates
+        come off a heap, so finding them costs time in proportion to the batch.
+        """
+        if self.archive is None:
+            return 0
+        cutoff = int(before.timestamp())
+        batch = []
+        heap = self._archive_heap
+        while heap and heap[0][0] < cutoff and len(batch) < limit:
+            _, order_id = heapq.heappop(heap)
+            order = self.orders_by_id.get(order_id)
+            if order is not None and order.status in ARCHIVED_STATUSES:
+                batch.append(order)
+        if not batch:
+            return 0
+        try:
+            self.archive.add_many(batch)
+        except Exception:
+            for order in batch:
+                heapq.heappush(heap, (order.timestamp, order.id))
+            raise
+        archived_ids = {order.id for order in batch}
+        self._remove_orders(archived_ids)
+        for order_id in archived_ids:
+            self._mark('order', order_id)
+        return len(batch)
+
     def get_pending_order(self, customer_id: int) -> Order:
         """Get the latest pending order for a customer"""
-        for order in reversed(self.orders):
-            if order.customer_id == customer_id and order.status == "pending":
-                return order
-        return None
+        pending = self.pending_orders.get(customer_id)
+        if not pending:
+            return None
+        # Dicts keep insertion order and orders are indexed in id order
+        return pending[next(reversed(pending))]
 
+    @_atomic
     def complete_order(self, order_id: int) -> bool:
         """Mark an order as completed and update customer total spent"""
-        for order in self.orders:
-            if order.id == order_id and order.status == "pending":
-                order.status = "completed"
-                # Update customer total spent
-                if order.customer_id in self.customers:
-                    self.customers[order.customer_id].total_spent += order.total
-                # Update product stock
-                for product_id, quantity in order.products.items():
-                    if product_id in self.products:
-                        self.products[product_id].stock -= quantity
-                return True
-        return False
+        order = self.orders_by_id.get(order_id)
+        if order is None or order.status != "pending":
+            return False
+
+        # Turn the hold into a real decrement below; stock is taken even if the hold
+        # already expired, since the payment has been made
+        self._unhold(order)
+        order.reserved_until = None
+        order.status = "completed"
+        self._index_order(order)
+        self.completion_log.append(order.id)
+        heapq.heappush(self._archive_heap, (order.timestamp, order.id))
+        self.revenue.record(order.total, order.date)
+        self._mark('order', order.id)
+        self._mark('revenue')
+        # Update customer total spent
+        if order.customer_id in self.customers:
+            self.customers[order.customer_id].total_spent += order.total
+            self._customer_changed(order.customer_id)
+        # Update product stock
+        for product_id, quantity in order.line_items():
+            if product_id in self.products:
+                self.products[product_id].stock -= quantity
+                self._product_changed(product_id)
+        return True
+
+    def available_stock(self, product_id: int) -> int:
+        """Stock not held by pending orders"""
+        return self.products[product_id].stock - self.reserved.get(product_id, 0)
+
+    def _hold(self, order: Order):
+        if order.reserved_until is None or order.status != "pending":
+            return
+        for product_id, quantity in order.line_items():
+            self.reserved[product_id] = self.reserved.get(product_id, 0) + quantity
+        heapq.heappush(self._reservation_heap, (order.reserved_until, order.id))
+
+    def _unhold(self, order: Order):
+        if order.reserved_until is None or order.status != "pending":
+            return
+        for product_id, quantity in order.line_items():
+            remaining = self.reserved.get(product_id, 0) - quantity
+            if remaining > 0:
+                self.reserved[product_id] = remaining
+            else:
+                self.reserved.pop(product_id, None)
+        # Its heap entry is skipped lazily once reserved_until no longer matches
+
+    @_atomic
+    def release_reservation(self, order_id: int) -> bool:
+        """Give a pending order's held stock back; the order itself stays pending"""
+        order = self.orders_by_id.get(order_id)
+        if order is None or order.status != "pending" or order.reserved_until is None:
+            return False
+        self._unhold(order)
+        order.reserved_until = None
+        self._mark('order', order.id)
+        return True
+
+    @_atomic
+    def release_expired_reservations(self, now: Optional[float] = None) -> int:
+        """Release every hold past its expiry; cost is proportional to the number expired"""
+        now = time.time() if now is None else now
+        released = 0
+        heap = self._reservation_heap
+        while heap and heap[0][0] <= now:
+            reserved_until, order_id = heapq.heappop(heap)
+            order = self.orders_by_id.get(order_id)
+            if order is not None and order.reserved_until == reserved_until and self.release_reservation(order_id):
+                released += 1
+        return released
+
+    @_atomic
+    def confirm_reservation(self, order_id: int) -> bool:
+        """Make sure a pending order's stock is held right before payment.
+
+        Extends a live hold, or re-takes an expired one if the stock is still available.
+        """
+        self.release_expired_reservations()
+        order = self.orders_by_id.get(order_id)
+        if order is None or order.status != "pending":
+            return False
+        if order.reserved_until is None:
+            for product_id, quantity in order.line_items():
+                if product_id not in self.products or self.available_stock(product_id) < quantity:
+                    return False
+        else:
+            self._unhold(order)
+        order.reserved_until = time.time() + self.RESERVATION_TTL
+        self._hold(order)
+        self._mark('order', order.id)
+        return True
+
+    @_atomic
+    def cancel_order(self, order_id: int) -> bool:
+        """Cancel a pending order and release its stock"""
+        order = self.orders_by_id.get(order_id)
+        if order is None or order.status != "pending":
+            return False
+        self._unhold(order)
+        order.reserved_until = None
+        order.status = "cancelled"
+        self._index_order(order)
+        heapq.heappush(self._archive_heap, (order.timestamp, order.id))
+        self._mark('order', order.id)
+        return True
+
+    @_atomic
+    def cancel_stale_orders(self, placed_before: float, limit: int) -> List[Order]:
+        """Cancel up to ``limit`` pending orders placed before ``placed_before`` (epoch seconds).
+
+        Cost is proportional to the number of orders that were due.
+        """
+        cancelled = []
+        heap = self._pending_heap
+        while heap and heap[0][0] < placed_before and len(cancelled) < limit:
+            _, order_id = heapq.heappop(heap)
+            # Orders completed or cancelled since they were pushed are skipped here
+            if self.cancel_order(order_id):
+                cancelled.append(self.orders_by_id[order_id])
+        return cancelled
+
+    def _cart_time(self, customer_id: int) -> Optional[float]:
+        customer = self.customers.get(customer_id)
+        return customer.cart_updated if customer is not None and customer.cart else None
+
+    def _unreminded_cart_time(self, customer_id: int) -> Optional[float]:
+        customer = self.customers.get(customer_id)
+        return customer.cart_updated if customer is not None and customer.cart and not customer.cart_reminded else None
+
+    @_atomic
+    def expire_carts(self, changed_before: float, limit: int) -> List[int]:
+        """Empty up to ``limit`` carts last changed before ``changed_before``; returns their customer ids"""
+        expired = []
+        if limit <= 0:
+            return expired
+        for customer_id in self._cart_expiry.pop_due(changed_before, self._cart_time):
+            customer = self.customers[customer_id]
+            customer.cart = {}
+            self._cart_changed(customer)
+            expired.append(customer.id)
+            if len(expired) >= limit:
+                break
+        return expired
+
+    @_atomic
+    def take_cart_reminders(self, changed_before: float, limit: int) -> List[int]:
+        """Mark up to ``limit`` carts idle since ``changed_before`` as reminded; returns their customer ids.
+
+        A cart is only ever taken once, by one process, until it changes again.
+        """
+        reminded = []
+        if limit <= 0:
+            return reminded
+        for customer_id in self._cart_reminders.pop_due(changed_before, self._unreminded_cart_time):
+            customer = self.customers[customer_id]
+            customer.cart_reminded = True
+            self._customer_changed(customer.id)
+            reminded.append(customer.id)
+            if len(reminded) >= limit:
+                break
+        return reminded
+
+    @_atomic
+    def take_low_stock_alerts(self, threshold: int, limit: int) -> List[Product]:
+        """Mark up to ``limit`` products at or below ``threshold`` as alerted; returns them, lowest stock first.
+
+        A product is only ever taken once, by one process, until its stock climbs back
+        above the threshold. After the first call, which sets up the due sets for the
+        threshold, cost is proportional to the products that crossed it since.
+        """
+        if threshold != self._alert_threshold:
+            self._alert_threshold = threshold
+            end = bisect.bisect_right(self.stock_index, (threshold, float('inf')))
+            self._low_stock_due = {product_id for _, product_id in self.stock_index[:end]
+                                   if not self.products[product_id].low_stock_alerted}
+            self._low_stock_rearm = {product.id for product in self.products.values()
+                                     if product.low_stock_alerted and product.stock > threshold}
+        for product_id in list(self._low_stock_rearm):
+            self.products[product_id].low_stock_alerted = False
+            self._product_changed(product_id)
+        due = heapq.nsmallest(limit, self._low_stock_due, key=lambda product_id: (self.products[product_id].stock, product_id))
+        alerted = []
+        for product_id in due:
+            product = self.products[product_id]
+            product.low_stock_alerted = True
+            self._product_changed(product_id)
+            alerted.append(product)
+        return alerted
+
+    @_atomic
+    def subscribe_restock(self, customer_id: int, product_id: int) -> bool:
+        """Ask to be told when a sold-out product is back; False if it is in stock or unknown"""
+        product = self.products.get(product_id)
+        if product is None or product.stock > 0:
+            return False
+        if customer_id not in product.restock_subscribers:
+            product.restock_subscribers[customer_id] = None
+            self._product_changed(product_id)
+        return True
+
+    @_atomic
+    def take_restock_notifications(self, limit: int) -> List[Tuple[Product, List[int]]]:
+        """Take up to ``limit`` subscribers of products back in stock, as (product, customer_ids).
+
+        Subscribers are taken oldest first and removed, so each is notified once; the rest
+        stay due for the next call.
+        """
+        taken = []
+        remaining = limit
+        for product_id in list(self._restock_due):
+            if remaining <= 0:
+                break
+            product = self.products[product_id]
+            subscribers = product.restock_subscribers
+            customer_ids = list(itertools.islice(subscribers, remaining))
+            if len(customer_ids) == len(subscribers):
+                product.restock_subscribers = {}
+            else:
+                for customer_id in customer_ids:
+                    del subscribers[customer_id]
+            self._product_changed(product_id)
+            taken.append((product, customer_ids))
+            remaining -= len(customer_ids)
+        return taken
+
+    @_atomic
+    def enqueue_support(self, user_id: int) -> int:
+        """Add a user to the support waiting queue and return their position"""
+        position = self.support_queue.enqueue(user_id)
+        self._mark('state')
+        return position
+
+    @_atomic
+    def leave_support_queue(self, user_id: int) -> bool:
+        if not self.support_queue.remove(user_id):
+            return False
+        self._mark('state')
+        return True
+
+    @_atomic
+    def start_support_session(self, user_id: int, admin_id: int) -> bool:
+        """Move a queued user into an active session with the given admin"""
+        if not self.support_queue.remove(user_id):
+            return False
+        self.active_support_sessions[user_id] = admin_id
+        self.admin_sessions.setdefault(admin_id, set()).add(user_id)
+        self._mark('state')
+        return True
+
+    @_atomic
+    def end_support_session(self, user_id: int) -> Optional[int]:
+        """End a user's support session and return the admin that was handling it"""
+        admin_id = self.active_support_sessions.pop(user_id, None)
+        if admin_id is not None:
+            sessions = self.admin_sessions.get(admin_id)
+            if sessions is not None:
+                sessions.discard(user_id)
+                if not sessions:
+                    del self.admin_sessions[admin_id]
+            self._mark('state')
+        return admin_id
+
+    def get_admin_sessions(self, admin_id: int) -> Set[int]:
+        return self.admin_sessions.get(admin_id, set())
+
+    @_atomic
+    def assign_support(self, admins: List[int], max_sessions: int,
+                       strategy: str = 'least_loaded') -> Optional[Tuple[int, int]]:
+        """Connect the longest-waiting user to an admin with spare capacity.
+
+        ``strategy`` is 'least_loaded' (fewest open sessions) or 'round_robin'.
+        Returns (user_id, admin_id), or None if nobody is waiting or every admin is busy.
+        """
+        if not self.support_queue or not admins:
+            return None
+        if strategy == 'round_robin':
+            admin_id = None
+            for offset in range(len(admins)):
+                index = (self._support_cursor + offset) % len(admins)
+                if len(self.get_admin_sessions(admins[index])) < max_sessions:
+                    admin_id = admins[index]
+                    self._support_cursor = index + 1
+                    break
+        else:
+            admin_id = min(admins, key=lambda admin: len(self.get_admin_sessions(admin)))
+            if len(self.get_admin_sessions(admin_id)) >= max_sessions:
+                admin_id = None
+        if admin_id is None:
+            return None
+        user_id = next(iter(self.support_queue))
+        self.start_support_session(user_id, admin_id)
+        return user_id, admin_id
+
+    @_atomic
+    def rebuild_revenue_stats(self) -> RevenueStats:
+        """Recompute the revenue rollups from every completed order"""
+        self.revenue = RevenueStats()
+        orders = [order for order in self.orders if order.status == "completed"]
+        if self.archive is not None:
+            orders.extend(order for order in self.archive.iter_orders() if order.id not in self.orders_by_id)
+        for order in sorted(orders, key=lambda o: o.timestamp):
+            if order.status == "completed":
+                self.revenue.record(order.total, order.date)
+        self._mark('revenue')
+        return self.revenue
 
     def get_revenue_stats(self) -> dict:
-        total_revenue = sum(order.total for order in self.orders if order.status == "completed")
-        total_orders = len([order for order in self.orders if order.status == "completed"])
-        return {
+        total_revenue = self.revenue.total_revenue
+        total_orders = self.revenue.total_orders
+        stats = {
             "total_revenue": total_revenue,
             "total_orders": total_orders,
             "average_order_value": total_revenue / total_orders if total_orders > 0 else 0
-        }
\ No newline at end of file
+        }
+        now = datetime.now()
+        for label, hours in (("24h", 24), ("7d", 24 * 7), ("30d", 24 * 30)):
+            revenue, orders = self.revenue.window(hours, now)
+            stats[f"revenue_{label}"] = revenue
+            stats[f"orders_{label}"] = orders
+        return stats
\ No newline at end of file
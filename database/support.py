@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from typing import Iterator, List, Optional
+
+class SupportQueue:
+    """FIFO of user ids waiting for support.
+
+    Enqueue, dequeue, membership and removal from the middle are O(1) through an
+    OrderedDict mapping each user to a ticket number. A Fenwick tree over the tickets
+    counts how many live tickets precede a user, giving queue positions in O(log n).
+    """
+
+    def __init__(self, user_ids: Optional[List[int]] = None):
+        self._rebuild(list(user_ids or ()))
+
+    def _rebuild(self, user_ids: List[int]):
+        # Renumber the live tickets 1..n and leave room for as many again
+        self._tickets: "OrderedDict[int, int]" = OrderedDict()
+        self._tree: List[int] = [0] * (max(64, 2 * len(user_ids)) + 1)
+        self._next_ticket = 1
+        for user_id in user_ids:
+            self.enqueue(user_id)
+
+    def _update(self, ticket: int, delta: int):
+        tree = self._tree
+        while ticket < len(tree):
+            tree[ticket] += delta
+            ticket += ticket & -ticket
+
+    def _prefix(self, ticket: int) -> int:
+        total = 0
+        tree = self._tree
+        while ticket > 0:
+            total += tree[ticket]
+            ticket -= ticket & -ticket
+        return total
+
+    def __getstate__(self):
+        return list(self._tickets)
+
+    def __setstate__(self, state):
+        self._rebuild(state)
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._tickets
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._tickets)
+
+    def enqueue(self, user_id: int) -> int:
+        """Add a user at the back; returns their 1-based position"""
+        if user_id in self._tickets:
+            return self.position(user_id)
+        if self._next_ticket >= len(self._tree):
+            self._rebuild(list(self._tickets))
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._tickets[user_id] = ticket
+        self._update(ticket, 1)
+        return len(self._tickets)
+
+    def remove(self, user_id: int) -> bool:
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is None:
+            return False
+        self._update(ticket, -1)
+        if not self._tickets:
+            self._rebuild([])
+        return True
+
+    def popleft(self) -> Optional[int]:
+        if not self._tickets:
+            return None
+        user_id = next(iter(self._tickets))
+        self.remove(user_id)
+        return user_id
+
+    def position(self, user_id: int) -> Optional[int]:
+        """1-based place in the queue, or None if the user is not waiting"""
+        ticket = self._tickets.get(user_id)
+        return None if ticket is None else self._prefix(ticket)
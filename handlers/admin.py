@@ -1,21 +1,42 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler
 from database.store import Store
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 ADDING_PRODUCT = range(1)
 
+# Completed and cancelled orders older than this move from memory to the on-disk archive
+ORDER_ARCHIVE_DAYS = float(os.getenv('ORDER_ARCHIVE_DAYS', '90'))
+ARCHIVE_INTERVAL = 60 * 60  # seconds between archiving runs
+ARCHIVE_BATCH = 1000  # orders moved between yields to the event loop
+
 async def admin_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     commands = """
 Admin Commands:
 /add_product - Add new product
+/import_products - Create or update products from a CSV/JSONL file
+/export_products [csv|jsonl] - Download all products
+/export_orders [csv|jsonl] - Download all orders
 /edit_product - Edit existing product
 /delete_product - Delete a product
 /view_products - View all products
 /view_orders - View all orders
 /view_customers - View all customers
+/low_stock [threshold] - Products running out, lowest stock first
 /dashboard - View sales dashboard
-/support_requests - View support requests
+/report [from] [to] [csv] - Sales report: top products, revenue per day, repeat customers
+/archive_orders - Archive old completed and cancelled orders now
+/support_requests - View support queue and sessions
+/end_support <user_id> - Close a support session
+/broadcast [message] - Send a message to all customers
+/metrics [prometheus|reset] - View handler and API metrics
 /git [command] - Execute git commands
+/reload - Load new handler code without restarting
 /restart - Restart the bot
 """
     await update.message.reply_text(commands)
@@ -62,9 +83,44 @@ async def view_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
 Total Revenue: ${stats['total_revenue']:.2f}
 Total Orders: {stats['total_orders']}
 Average Order Value: ${stats['average_order_value']:.2f}
+
+Last 24h: ${stats['revenue_24h']:.2f} ({stats['orders_24h']} orders)
+Last 7 days: ${stats['revenue_7d']:.2f} ({stats['orders_7d']} orders)
+Last 30 days: ${stats['revenue_30d']:.2f} ({stats['orders_30d']} orders)
+
+Orders in memory: {len(store.orders)}
+Archived orders: {store.archive.count() if store.archive is not None else 0}
 """
     await update.message.reply_text(dashboard)
 
+async def archive_old_orders(store: Store) -> int:
+    """Move completed and cancelled orders older than ORDER_ARCHIVE_DAYS to the archive, in batches"""
+    before = datetime.now() - timedelta(days=ORDER_ARCHIVE_DAYS)
+    archived = 0
+    while True:
+        moved = store.archive_orders(before, limit=ARCHIVE_BATCH)
+        archived += moved
+        if moved < ARCHIVE_BATCH:
+            return archived
+        await asyncio.sleep(0)
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE):
+    archived = await archive_old_orders(context.bot_data['store'])
+    if archived:
+        logger.info("Archived %d orders", archived)
+
+async def archive_orders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    store: Store = context.bot_data['store']
+    if store.archive is None:
+        await update.message.reply_text("Order archiving needs the journal persistence; it is not enabled.")
+        return
+    archived = await archive_old_orders(store)
+    await update.message.reply_text(f"Archived {archived} orders older than {ORDER_ARCHIVE_DAYS:g} days.")
+
 def register_admin_handlers(application):
     # Add product conversation
     add_product_conv = ConversationHandler(
@@ -77,4 +133,7 @@ def register_admin_handlers(application):
     
     application.add_handler(add_product_conv)
     application.add_handler(CommandHandler('admin_help', admin_help))
-    application.add_handler(CommandHandler('dashboard', view_dashboard))
\ No newline at end of file
+    application.add_handler(CommandHandler('dashboard', view_dashboard))
+    application.add_handler(CommandHandler('archive_orders', archive_orders_command))
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(archive_job, interval=ARCHIVE_INTERVAL, first=60)
\ No newline at end of file
@@ -0,0 +1,174 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+from telegram.error import Forbidden, BadRequest, RetryAfter, TelegramError
+from database.store import Store
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Set
+import asyncio
+import os
+import logging
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts of up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: int = 0
+
+class Broadcaster:
+    """Concurrent, rate-limited message fan-out.
+
+    A global token bucket keeps the bot under Telegram's overall limit and a
+    per-chat minimum interval keeps each chat under its own limit. Flood control
+    (RetryAfter) pauses the global bucket and the message is retried.
+    """
+
+    def __init__(self, application, global_rate: float = 25, per_chat_interval: float = 1.0,
+                 concurrency: int = 8, max_retries: int = 3):
+        self.application = application
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chat_ready: Dict[int, float] = {}  # chat_id: monotonic time of next allowed send
+        self._tasks: Set[asyncio.Task] = set()  # broadcasts started by submit()
+
+    async def _wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        ready = self._chat_ready.get(chat_id, now)
+        self._chat_ready[chat_id] = max(ready, now) + self.per_chat_interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+        if len(self._chat_ready) > 10000:
+            # Forget chats that are no longer being throttled
+            self._chat_ready = {cid: t for cid, t in self._chat_ready.items() if t > now}
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Send one message, honouring rate limits and retrying on flood control"""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_chat(chat_id)
+            await self.global_bucket.acquire()
+            try:
+                async with self._slots:
+                    await self.application.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                self.global_bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # Blocked the bot, deleted account, bad chat id: retrying will not help
+                logger.info("Broadcast to %s failed: %s", chat_id, e)
+                return False
+            except TelegramError as e:
+                logger.warning("Broadcast to %s failed (attempt %d): %s", chat_id, attempt + 1, e)
+                await asyncio.sleep(2 ** attempt)
+        return False
+
+    async def broadcast(self, chat_ids: Iterable[int], text: str, **kwargs) -> BroadcastResult:
+        """Send the same message to every chat and wait until all are delivered or failed"""
+        result = BroadcastResult()
+        chat_ids = iter(chat_ids)
+
+        async def worker():
+            # Workers share one iterator, so at most ``concurrency`` sends are in flight
+            for chat_id in chat_ids:
+                if await self.send(chat_id, text, **kwargs):
+                    result.sent += 1
+                else:
+                    result.failed += 1
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return result
+
+    def submit(self, chat_ids: Iterable[int], text: str, on_done=None, **kwargs) -> asyncio.Task:
+        """Start a broadcast in the background and return immediately.
+
+        ``on_done`` is awaited with the BroadcastResult once every message is handled.
+        """
+        async def run():
+            result = await self.broadcast(chat_ids, text, **kwargs)
+            if on_done is not None:
+                await on_done(result)
+            return result
+
+        task = self.application.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def join(self):
+        """Wait until every submitted broadcast has finished"""
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+# Kept across a hot reload (handlers/reload.py), so running broadcasts and the
+# global rate limit are not duplicated
+_broadcasters: "weakref.WeakKeyDictionary" = globals().get('_broadcasters') or weakref.WeakKeyDictionary()
+
+def get_broadcaster(application) -> Broadcaster:
+    """Return the application's Broadcaster, creating it on first use"""
+    broadcaster: Optional[Broadcaster] = _broadcasters.get(application)
+    if broadcaster is None:
+        # Telegram's global limit is per bot, so workers of one bot share it
+        workers = int(os.getenv('WORKER_COUNT', '1'))
+        broadcaster = _broadcasters[application] = Broadcaster(application, global_rate=25 / workers)
+    return broadcaster
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Send a promotional message to every customer"""
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    if not context.args:
+        await update.message.reply_text("Please provide a message. Example: /broadcast 20% off today!")
+        return
+
+    store: Store = context.bot_data['store']
+    text = update.message.text.split(maxsplit=1)[1]
+    chat_id = update.effective_chat.id
+
+    async def report(result: BroadcastResult):
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"Broadcast finished: {result.sent} delivered, {result.failed} failed."
+        )
+
+    # Snapshot the ids so customers added mid-broadcast do not break iteration
+    get_broadcaster(context.application).submit(list(store.customers), text, on_done=report)
+    await update.message.reply_text(f"Broadcasting to {len(store.customers)} customers...")
+
+def register_broadcast_handlers(application):
+    application.add_handler(CommandHandler('broadcast', broadcast_command))
@@ -0,0 +1,213 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler
+from database.store import Store
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import csv
+import itertools
+import json
+import math
+import os
+import tempfile
+
+IMPORTING_PRODUCTS = 0
+
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'stock', 'image_url')
+ORDER_FIELDS = ('id', 'customer_id', 'status', 'total', 'date', 'products')
+BATCH_SIZE = 500  # rows applied between yields to the event loop
+MAX_REPORTED_ERRORS = 10
+
+def iter_rows(path: str, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, row) from a CSV or JSON Lines file, one row at a time"""
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        if fmt == 'csv':
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_num, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f"invalid JSON: {e}"}
+                yield line_num, row if isinstance(row, dict) else {'__error__': "not a JSON object"}
+
+def _present(row: dict, key: str) -> bool:
+    value = row.get(key)
+    return value is not None and str(value).strip() != ''
+
+def parse_product_row(row: dict) -> Tuple[Optional[int], Dict[str, object]]:
+    """Validate one row; returns (product id or None, fields to set). Raises ValueError."""
+    if '__error__' in row:
+        raise ValueError(row['__error__'])
+    product_id = int(row['id']) if _present(row, 'id') else None
+    fields: Dict[str, object] = {}
+    for key in ('name', 'description', 'image_url'):
+        if _present(row, key):
+            fields[key] = str(row[key]).strip()
+    if _present(row, 'price'):
+        fields['price'] = float(row['price'])
+        if not math.isfinite(fields['price']):
+            raise ValueError("price must be a finite number")
+        if fields['price'] < 0:
+            raise ValueError("price must not be negative")
+    if _present(row, 'stock'):
+        fields['stock'] = int(row['stock'])
+        if fields['stock'] < 0:
+            raise ValueError("stock must not be negative")
+    if product_id is None:
+        missing = [key for key in ('name', 'price', 'stock') if key not in fields]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+    elif not fields:
+        raise ValueError("nothing to update")
+    return product_id, fields
+
+async def import_products(store: Store, path: str, fmt: str) -> Tuple[int, int, List[str]]:
+    """Apply a product file to the store; returns (created, updated, errors)"""
+    created = updated = failed = 0
+    errors: List[str] = []
+    for count, (line_num, row) in enumerate(iter_rows(path, fmt), 1):
+        try:
+            product_id, fields = parse_product_row(row)
+            if product_id is None:
+                store.add_product(fields['name'], fields.get('description', ''), fields['price'],
+                                  fields['stock'], fields.get('image_url', ''))
+                created += 1
+            elif store.update_product(product_id, **fields):
+                updated += 1
+            else:
+                raise ValueError(f"no product with id {product_id}")
+        except (ValueError, TypeError) as e:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"line {line_num}: {e}")
+        if count % BATCH_SIZE == 0:
+            # Let other updates run between batches
+            await asyncio.sleep(0)
+    return created, updated, errors + ([f"... {failed - len(errors)} more"] if failed > len(errors) else [])
+
+async def write_products(store: Store, file, fmt: str):
+    writer = csv.writer(file) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(PRODUCT_FIELDS)
+    # Ids are snapshotted so the store can change while we yield
+    for count, product_id in enumerate(list(store.products), 1):
+        product = store.products.get(product_id)
+        if product is None:
+            continue
+        values = (product.id, product.name, product.description, product.price, product.stock, product.image_url)
+        if writer:
+            writer.writerow(values)
+        else:
+            file.write(json.dumps(dict(zip(PRODUCT_FIELDS, values))) + "\n")
+        if count % BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+
+async def write_orders(store: Store, file, fmt: str):
+    writer = csv.writer(file) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(ORDER_FIELDS)
+    # Archived orders first, then a snapshot of the in-memory ones; both are in id order
+    hot = list(store.orders)
+    hot_ids = {order.id for order in hot}
+    archived = store.archive.iter_orders() if store.archive is not None else ()
+    orders = itertools.chain((order for order in archived if order.id not in hot_ids), hot)
+    for index, order in enumerate(orders):
+        if writer:
+            products = ";".join(f"{pid}:{qty}" for pid, qty in order.products.items())
+            writer.writerow((order.id, order.customer_id, order.status, order.total, order.date.isoformat(), products))
+        else:
+            file.write(json.dumps({
+                'id': order.id, 'customer_id': order.customer_id, 'status': order.status,
+                'total': order.total, 'date': order.date.isoformat(),
+                'products': {str(pid): qty for pid, qty in order.products.items()},
+            }) + "\n")
+        if (index + 1) % BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+
+def _is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    return update.effective_user.id in context.bot_data.get('admins', [])
+
+async def import_products_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not _is_admin(update, context):
+        await update.message.reply_text("Unauthorized access.")
+        return ConversationHandler.END
+
+    await update.message.reply_text(
+        "Please send a .csv or .jsonl file with the columns:\n"
+        f"{', '.join(PRODUCT_FIELDS)}\n"
+        "Rows with an existing id update that product; rows without id create a new one."
+    )
+    return IMPORTING_PRODUCTS
+
+async def import_products_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    name = (document.file_name or '').lower()
+    if name.endswith('.csv'):
+        fmt = 'csv'
+    elif name.endswith(('.jsonl', '.ndjson', '.json')):
+        fmt = 'jsonl'
+    else:
+        await update.message.reply_text("Unsupported file type. Please send a .csv or .jsonl file.")
+        return IMPORTING_PRODUCTS
+
+    store: Store = context.bot_data['store']
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        telegram_file = await document.get_file()
+        await telegram_file.download_to_drive(custom_path=path)
+        created, updated, errors = await import_products(store, path, fmt)
+    except Exception as e:
+        await update.message.reply_text(f"Error importing products: {str(e)}")
+        return ConversationHandler.END
+    finally:
+        os.remove(path)
+
+    summary = f"Import finished.\nCreated: {created}\nUpdated: {updated}"
+    if errors:
+        summary += "\nFailed rows:\n" + "\n".join(errors)
+    await update.message.reply_text(summary)
+    return ConversationHandler.END
+
+async def cancel_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text("Import cancelled.")
+    return ConversationHandler.END
+
+async def _export(update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, write):
+    if not _is_admin(update, context):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    fmt = 'jsonl' if context.args and context.args[0].lower() in ('jsonl', 'json') else 'csv'
+    store: Store = context.bot_data['store']
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+            await write(store, file, fmt)
+        with open(path, 'rb') as file:
+            await update.message.reply_document(document=file, filename=f"{kind}.{fmt}")
+    finally:
+        os.remove(path)
+
+async def export_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _export(update, context, 'products', write_products)
+
+async def export_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await _export(update, context, 'orders', write_orders)
+
+def register_bulk_handlers(application):
+    import_conv = ConversationHandler(
+        entry_points=[CommandHandler('import_products', import_products_start)],
+        states={
+            IMPORTING_PRODUCTS: [MessageHandler(filters.Document.ALL, import_products_file)]
+        },
+        fallbacks=[CommandHandler('cancel', cancel_import)]
+    )
+
+    application.add_handler(import_conv)
+    application.add_handler(CommandHandler('export_products', export_products))
+    application.add_handler(CommandHandler('export_orders', export_orders))
@@ -0,0 +1,94 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CallbackQueryHandler
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Callback data is "<version>|<action>|<arg>|<arg>...", e.g. "1|ac|42". Bump the version
+# when the meaning of an action's arguments changes; buttons with another version are
+# rejected instead of being misread. Telegram limits callback data to 64 bytes.
+CALLBACK_VERSION = '1'
+SEPARATOR = '|'
+
+# Action codes
+ADD_TO_CART = 'ac'
+CHECKOUT = 'co'
+NOTIFY_RESTOCK = 'nr'
+ORDERS_PAGE = 'op'
+PRODUCTS_PAGE = 'pp'
+SUPPORT_ACCEPT = 'sa'
+
+# Callback data used before the router existed, still present on old messages
+LEGACY_PREFIXES = (
+    ('add_to_cart_', ADD_TO_CART),
+    ('products_page_', PRODUCTS_PAGE),
+    ('support_accept_', SUPPORT_ACCEPT),
+    ('checkout', CHECKOUT),
+)
+
+def encode_callback(action: str, *args) -> str:
+    data = SEPARATOR.join((CALLBACK_VERSION, action, *map(str, args)))
+    if len(data.encode()) > 64:
+        raise ValueError(f"Callback data too long: {data}")
+    return data
+
+def decode_callback(data: str) -> Optional[Tuple[str, List[str]]]:
+    """Return (action, args) or None if the data is not understood"""
+    if SEPARATOR in data:
+        version, action, *args = data.split(SEPARATOR)
+        if version != CALLBACK_VERSION:
+            return None
+        return action, args
+    for prefix, action in LEGACY_PREFIXES:
+        if data.startswith(prefix):
+            rest = data[len(prefix):]
+            return action, [rest] if rest else []
+    return None
+
+def _convert_args(args: List[str], arg_types: Tuple[type, ...]) -> Optional[list]:
+    if len(args) != len(arg_types):
+        return None
+    try:
+        return [arg_type(arg) for arg_type, arg in zip(arg_types, args)]
+    except ValueError:
+        return None
+
+class CallbackRouter:
+    """Dispatches every callback query to the handler registered for its action.
+
+    Each route declares the types of its arguments; routed handlers receive them
+    converted in ``context.args``. Data with the wrong number or type of arguments
+    is answered like an unknown action and never reaches the handler.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Tuple[Callable, Tuple[type, ...]]] = {}
+
+    def add(self, action: str, callback: Callable, arg_types: Tuple[type, ...] = ()):
+        if action in self.routes:
+            raise ValueError(f"Callback action {action!r} is already routed")
+        self.routes[action] = (callback, arg_types)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        decoded = decode_callback(query.data or '')
+        route = self.routes.get(decoded[0]) if decoded else None
+        args = _convert_args(decoded[1], route[1]) if route else None
+        if args is None:
+            logger.debug("Unroutable callback data: %r", query.data)
+            await query.answer("This button is no longer available.")
+            return
+        context.args = args
+        return await route[0](update, context)
+
+_routers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def get_callback_router(application) -> CallbackRouter:
+    """Return the application's router, registering its CallbackQueryHandler on first use"""
+    router: Optional[CallbackRouter] = _routers.get(application)
+    if router is None:
+        router = _routers[application] = CallbackRouter()
+        application.add_handler(CallbackQueryHandler(router.dispatch))
+    return router
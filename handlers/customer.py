@@ -4,80 +4,199 @@ import os
 # Add the project directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, LabeledPrice
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, PreCheckoutQueryHandler, MessageHandler, filters
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, LabeledPrice, InlineQueryResultArticle, InputTextMessageContent
+from telegram.constants import InlineQueryLimit
+from telegram.ext import ContextTypes, CommandHandler, InlineQueryHandler, PreCheckoutQueryHandler, MessageHandler, filters
 
 from database.store import Store
+from handlers.callbacks import get_callback_router, encode_callback, ADD_TO_CART, CHECKOUT, PRODUCTS_PAGE, ORDERS_PAGE
+from handlers.render import get_render_cache
+from handlers.throttle import get_tap_coalescer
+
+PRODUCTS_PAGE_SIZE = 5
+
+async def send_products_page(message, store: Store, page: int):
+    """Send one catalog page as a media group followed by its buttons"""
+    products = store.get_products_page(page, PRODUCTS_PAGE_SIZE)
+    if not products:
+        await message.reply_text("No more products.")
+        return
+
+    # Captions, media and buttons are prebuilt and reused until the product changes;
+    # media carry the Telegram file_id from an earlier upload once there is one
+    cache = get_render_cache(store)
+    # A product without an image would make Telegram reject the whole media group,
+    # so those are sent as plain text instead
+    pictured = [product for product in products if product.photo_file_id or product.image_url]
+    for product in products:
+        if not (product.photo_file_id or product.image_url):
+            await message.reply_text(cache.caption(product))
+    media = [cache.media(product) for product in pictured]
+    if len(media) == 1:
+        sent = [await message.reply_photo(photo=media[0].media, caption=media[0].caption)]
+    elif media:
+        sent = await message.reply_media_group(media=media)
+    else:
+        sent = []
+    for product, sent_message in zip(pictured, sent):
+        if sent_message.photo:
+            store.set_product_file_id(product.id, sent_message.photo[-1].file_id)
+
+    reply_markup, text = cache.page_keyboard(products, page, PRODUCTS_PAGE_SIZE)
+    await message.reply_text(text, reply_markup=reply_markup)
 
 async def view_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store: Store = context.bot_data.get('store', Store())  
     
-    if store or not store.products:
+    if not store.products:
         await update.message.reply_text("No products available.")
         return
     
-    for product in store.products.values():
-        keyboard = [
-            [InlineKeyboardButton("Add to Cart", callback_data=f"add_to_cart_{product.id}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message = f"""
-{product.name}
-Description: {product.description}
-Price: ${product.price:.2f}
-Stock: {product.stock}
-"""
-        await update.message.reply_photo(
-            photo=product.image_url,
-            caption=message,
-            reply_markup=reply_markup
+    await send_products_page(update.message, store, 0)
+
+SEARCH_RESULTS_LIMIT = 10
+
+async def search_products(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    store: Store = context.bot_data['store']
+    
+    if not context.args:
+        await update.message.reply_text("Please provide search terms. Example: /search red shoes")
+        return
+    
+    products = store.search_products(" ".join(context.args), SEARCH_RESULTS_LIMIT)
+    if not products:
+        await update.message.reply_text("No products found.")
+        return
+    
+    cache = get_render_cache(store)
+    lines = [f"{product.name} - ${product.price:.2f}" for product in products]
+    keyboard = [[cache.product_button(product)] for product in products]
+    await update.message.reply_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer @bot inline queries from the product search index"""
+    store: Store = context.bot_data['store']
+    query = update.inline_query
+    cache = get_render_cache(store)
+    
+    results = [
+        InlineQueryResultArticle(
+            id=str(product.id),
+            title=product.name,
+            description=f"${product.price:.2f} - {product.description}",
+            thumbnail_url=product.image_url or None,
+            input_message_content=InputTextMessageContent(cache.caption(product)),
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("Add to Cart", callback_data=encode_callback(ADD_TO_CART, product.id))
+            ]])
         )
+        for product in store.search_products(query.query, InlineQueryLimit.RESULTS)
+    ]
+    await query.answer(results, cache_time=30)
 
 async def view_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store: Store = context.bot_data['store']
     user_id = update.effective_user.id
     
-    if user_id not in store.customers or not store.customers[user_id].cart:
+    cart = get_render_cache(store).cart(user_id)
+    if cart is None:
         await update.message.reply_text("Your cart is empty.")
         return
     
-    customer = store.customers[user_id]
-    cart_items = []
-    total = 0
-    
-    for product_id, quantity in customer.cart.items():
-        product = store.products[product_id]
-        subtotal = product.price * quantity
-        total += subtotal
-        cart_items.append(f"{product.name} x{quantity} - ${subtotal:.2f}")
+    cart_message, reply_markup = cart
+    await update.message.reply_text(cart_message, reply_markup=reply_markup)
+
+async def _add_to_cart(store: Store, query, product_id: int, quantity: int):
+    if store.add_to_cart(query.from_user.id, product_id, quantity):
+        await query.answer("Product added to cart!" if quantity == 1 else f"Added {quantity} to cart!")
+    else:
+        await query.answer("Failed to add product to cart.")
+
+async def handle_add_to_cart(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    store: Store = context.bot_data['store']
+    user_id = query.from_user.id
     
-    cart_message = "\n".join(cart_items) + f"\n\nTotal: ${total:.2f}"
+    product_id = context.args[0]
+
+    async def add_merged(latest, count: int):
+        store.add_to_cart(user_id, product_id, count)
+
+    # Taps on the same button right after this one are added to the cart as one quantity
+    coalescer = get_tap_coalescer(context.application)
+    if coalescer.tap((user_id, product_id), query, add_merged):
+        await _add_to_cart(store, query, product_id, 1)
+    else:
+        # Only the cart change is merged; every tap's spinner stops right away
+        await query.answer()
+
+async def handle_products_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    store: Store = context.bot_data['store']
     
-    keyboard = [[InlineKeyboardButton("Checkout", callback_data="checkout")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    page = context.args[0]
+    await query.answer()
+    await send_products_page(query.message, store, page)
+
+async def handle_checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    store: Store = context.bot_data['store']
     
-    await update.message.reply_text(cart_message, reply_markup=reply_markup)
+    await query.answer()
+    order = store.create_order(query.from_user.id)
+    if order:
+        await query.message.reply_text(
+            f"Order created! Total: ${order.total:.2f}\n"
+            "Use /pay to complete your purchase."
+        )
+    else:
+        await query.message.reply_text("Failed to create order. Your cart is empty or some items are out of stock.")
+
+ORDERS_PAGE_SIZE = 10
+def orders_page(store: Store, customer_id: int, page: int):
+    """Text and keyboard for one page of a customer's order history"""
+    total = store.count_customer_orders(customer_id)
+    orders = store.get_customer_orders(customer_id, ORDERS_PAGE_SIZE, page * ORDERS_PAGE_SIZE)
+    if not orders:
+        return "You have no orders yet.", None
+    total_pages = (total + ORDERS_PAGE_SIZE - 1) // ORDERS_PAGE_SIZE
+    lines = [f"Your orders (page {page + 1} of {total_pages}):", ""]
+    lines += [f"#{order.id}  {order.date:%Y-%m-%d}  {order.status}  ${order.total:.2f}" for order in orders]
+    lines.append("\nUse /receipt <order id> to see an order's details.")
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀ Previous", callback_data=encode_callback(ORDERS_PAGE, page - 1)))
+    if (page + 1) * ORDERS_PAGE_SIZE < total:
+        navigation.append(InlineKeyboardButton("Next ▶", callback_data=encode_callback(ORDERS_PAGE, page + 1)))
+    return "\n".join(lines), InlineKeyboardMarkup([navigation]) if navigation else None
+
+async def view_orders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    store: Store = context.bot_data['store']
+    text, reply_markup = orders_page(store, update.effective_user.id, 0)
+    await update.message.reply_text(text, reply_markup=reply_markup)
 
-async def handle_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def handle_orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     store: Store = context.bot_data['store']
     
-    if query.data.startswith("add_to_cart_"):
-        product_id = int(query.data.split("_")[-1])
-        if store.add_to_cart(query.from_user.id, product_id, 1):
-            await query.answer("Product added to cart!")
-        else:
-            await query.answer("Failed to add product to cart.")
-    elif query.data == "checkout":
-        order = store.create_order(query.from_user.id)
-        if order:
-            await query.message.reply_text(
-                f"Order created! Total: ${order.total:.2f}\n"
-                "Use /pay to complete your purchase."
-            )
-        else:
-            await query.message.reply_text("Failed to create order.")
+    await query.answer()
+    text, reply_markup = orders_page(store, query.from_user.id, context.args[0])
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def view_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    store: Store = context.bot_data['store']
+    user_id = update.effective_user.id
+    
+    if not context.args or not context.args[0].lstrip('#').isdigit():
+        await update.message.reply_text("Usage: /receipt <order id>")
+        return
+    
+    order = store.get_order(int(context.args[0].lstrip('#')))
+    if order is None or (order.customer_id != user_id and user_id not in context.bot_data.get('admins', [])):
+        await update.message.reply_text("Order not found.")
+        return
+    
+    await update.message.reply_text(get_render_cache(store).receipt(order))
 
 async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store: Store = context.bot_data['store']
@@ -113,10 +232,19 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def precheckout_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle the pre-checkout callback"""
     query = update.pre_checkout_query
+    store: Store = context.bot_data['store']
+    
+    try:
+        order = store.get_order(int(query.invoice_payload.split('_')[1]))
+    except (IndexError, ValueError):
+        order = None
     
-    # Always accept the checkout for this example
-    # In a real application, you might want to verify stock availability here
-    await query.answer(ok=True)
+    if order is None or order.status != "pending" or query.total_amount != int(order.total * 100):
+        await query.answer(ok=False, error_message="This order is no longer valid. Please check out again.")
+    elif not store.confirm_reservation(order.id):
+        await query.answer(ok=False, error_message="Sorry, some items in your order are out of stock.")
+    else:
+        await query.answer(ok=True)
 
 async def successful_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle successful payments"""
@@ -134,8 +262,16 @@ async def successful_payment_callback(update: Update, context: ContextTypes.DEFA
 def register_customer_handlers(application):
     application.add_handler(CommandHandler('products', view_products))
     application.add_handler(CommandHandler('cart', view_cart))
+    application.add_handler(CommandHandler('search', search_products))
+    application.add_handler(InlineQueryHandler(inline_search))
     application.add_handler(CommandHandler('pay', process_payment))
-    application.add_handler(CallbackQueryHandler(handle_cart_callback))
+    application.add_handler(CommandHandler('orders', view_orders))
+    application.add_handler(CommandHandler('receipt', view_receipt))
+    router = get_callback_router(application)
+    router.add(ADD_TO_CART, handle_add_to_cart, (int,))
+    router.add(PRODUCTS_PAGE, handle_products_page, (int,))
+    router.add(CHECKOUT, handle_checkout)
+    router.add(ORDERS_PAGE, handle_orders_page, (int,))
     application.add_handler(PreCheckoutQueryHandler(precheckout_callback))
     
     # name 'MessageHandler' is not defined
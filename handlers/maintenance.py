@@ -0,0 +1,79 @@
+from telegram.ext import ContextTypes
+from database.store import Store
+from handlers.broadcast import get_broadcaster
+from handlers.render import get_render_cache
+from handlers.stock import run_stock_alerts
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+CART_TTL_HOURS = float(os.getenv('CART_TTL_HOURS', '72'))  # carts untouched this long are emptied
+CART_REMINDER_HOURS = float(os.getenv('CART_REMINDER_HOURS', '24'))  # 0 turns reminders off
+CART_REMINDERS_PER_SWEEP = int(os.getenv('CART_REMINDERS_PER_SWEEP', '20'))
+PENDING_ORDER_TTL_HOURS = float(os.getenv('PENDING_ORDER_TTL_HOURS', '24'))  # unpaid orders are cancelled after this
+MAINTENANCE_INTERVAL = 60  # seconds between sweeps
+SWEEP_BATCH = 500  # items handled per store transaction
+
+CART_REMINDER_TEXT = ("🛒 You still have items in your cart. "
+                      "Use /cart to check out before they are released.")
+
+async def _in_batches(sweep: Callable[[int], List]) -> List:
+    """Call ``sweep(limit)`` until it returns a short batch, letting other updates run in between"""
+    done = []
+    while True:
+        batch = sweep(SWEEP_BATCH)
+        done.extend(batch)
+        if len(batch) < SWEEP_BATCH:
+            return done
+        await asyncio.sleep(0)
+
+async def run_maintenance(application, now: Optional[float] = None) -> Dict[str, int]:
+    """One sweep: expire holds, stale orders, idle carts and PayPal links, send due reminders and stock alerts.
+
+    Due times come from heaps kept by the store and the link registry, so a sweep
+    costs time in proportion to what is due, not to the size of the store. The one
+    walk is the render cache prune, over cached entries only.
+    """
+    store: Store = application.bot_data['store']
+    now = time.time() if now is None else now
+    stats = {'released_holds': store.release_expired_reservations(now)}
+
+    cancelled = await _in_batches(
+        lambda limit: store.cancel_stale_orders(now - PENDING_ORDER_TTL_HOURS * 3600, limit))
+    stats['cancelled_orders'] = len(cancelled)
+    stats['expired_carts'] = len(await _in_batches(
+        lambda limit: store.expire_carts(now - CART_TTL_HOURS * 3600, limit)))
+
+    paypal_handler = application.bot_data.get('paypal_handler')
+    if paypal_handler is not None:
+        links = paypal_handler.payment_links
+        for order in cancelled:
+            # A cancelled order can no longer be paid for
+            payment_id = links.by_order.get(order.id)
+            if payment_id is not None:
+                links.remove(payment_id)
+        stats['purged_links'] = links.purge_expired(now)
+
+    reminded = []
+    if CART_REMINDER_HOURS > 0:
+        # At most CART_REMINDERS_PER_SWEEP per sweep; the rest stay due for the next one
+        reminded = store.take_cart_reminders(now - CART_REMINDER_HOURS * 3600, CART_REMINDERS_PER_SWEEP)
+        if reminded:
+            get_broadcaster(application).submit(reminded, CART_REMINDER_TEXT)
+    stats['cart_reminders'] = len(reminded)
+    stats.update(await run_stock_alerts(application))
+    stats['pruned_renders'] = get_render_cache(store).prune()
+    return stats
+
+async def maintenance_job(context: ContextTypes.DEFAULT_TYPE):
+    stats = await run_maintenance(context.application)
+    if any(stats.values()):
+        logger.info("Maintenance: %s", ", ".join(f"{name} {count}" for name, count in stats.items()))
+
+def register_maintenance_handlers(application):
+    if application.job_queue is not None:
+        application.job_queue.run_repeating(maintenance_job, interval=MAINTENANCE_INTERVAL, first=MAINTENANCE_INTERVAL)
@@ -0,0 +1,209 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler, ConversationHandler, ApplicationHandlerStop
+from telegram.request import BaseRequest
+from prettytable import PrettyTable
+from handlers.callbacks import CallbackRouter
+from functools import wraps
+from typing import Dict, List, Optional
+import bisect
+import html
+import io
+import time
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'errors')
+
+    def __init__(self):
+        self.counts: List[int] = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket containing the q-th observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+class MetricsRegistry:
+    """In-memory handler and Bot API metrics.
+
+    Recording an observation is a dict lookup, a bisect over 14 buckets and a few
+    integer additions, cheap enough to leave on in production.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, Histogram] = {}
+        self.api_calls: Dict[str, Histogram] = {}
+        self.started = time.time()
+
+    def observe_handler(self, name: str, seconds: float, error: bool = False):
+        histogram = self.handlers.get(name)
+        if histogram is None:
+            histogram = self.handlers[name] = Histogram()
+        histogram.observe(seconds, error)
+
+    def observe_api_call(self, endpoint: str, seconds: float, error: bool = False):
+        histogram = self.api_calls.get(endpoint)
+        if histogram is None:
+            histogram = self.api_calls[endpoint] = Histogram()
+        histogram.observe(seconds, error)
+
+    def reset(self):
+        self.handlers.clear()
+        self.api_calls.clear()
+        self.started = time.time()
+
+    def render_table(self) -> str:
+        sections = []
+        for title, metrics in (("Handlers", self.handlers), ("Bot API", self.api_calls)):
+            table = PrettyTable([title, "calls", "errors", "avg ms", "p50 ms", "p99 ms"])
+            table.align[title] = "l"
+            for name, histogram in sorted(metrics.items(), key=lambda item: -item[1].total):
+                table.add_row([
+                    name, histogram.count, histogram.errors,
+                    f"{histogram.total / histogram.count * 1000:.1f}",
+                    f"{histogram.quantile(0.5) * 1000:g}",
+                    f"{histogram.quantile(0.99) * 1000:g}",
+                ])
+            sections.append(table.get_string())
+        return "\n\n".join(sections)
+
+    def render_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric, label, metrics in (("bot_handler", "handler", self.handlers),
+                                       ("bot_api_call", "endpoint", self.api_calls)):
+            lines.append(f"# TYPE {metric}_duration_seconds histogram")
+            for name, histogram in metrics.items():
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                    lines.append(f'{metric}_duration_seconds_bucket{{{label}="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_duration_seconds_sum{{{label}="{name}"}} {histogram.total}')
+                lines.append(f'{metric}_duration_seconds_count{{{label}="{name}"}} {histogram.count}')
+            lines.append(f"# TYPE {metric}_errors_total counter")
+            for name, histogram in metrics.items():
+                lines.append(f'{metric}_errors_total{{{label}="{name}"}} {histogram.errors}')
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry, shared by every instrumented handler and request. A hot
+# reload (handlers/reload.py) keeps the existing one so the counts carry over.
+REGISTRY: MetricsRegistry = globals().get('REGISTRY') or MetricsRegistry()
+
+def instrument_callback(callback, name: Optional[str] = None, registry: MetricsRegistry = REGISTRY):
+    """Wrap a handler callback so every call is timed and counted"""
+    if getattr(callback, '__metrics_wrapped__', False):
+        return callback
+    name = name or callback.__qualname__
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        error = False
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            registry.observe_handler(name, time.perf_counter() - start, error)
+
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+def _instrument_handler(handler, registry: MetricsRegistry):
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            _instrument_handler(inner, registry)
+    elif isinstance(getattr(handler.callback, '__self__', None), CallbackRouter):
+        # Time each routed action separately rather than the router as a whole
+        router = handler.callback.__self__
+        for action, (callback, arg_types) in router.routes.items():
+            router.routes[action] = (instrument_callback(callback, registry=registry), arg_types)
+    elif hasattr(handler, 'callback'):
+        handler.callback = instrument_callback(handler.callback, registry=registry)
+
+def instrument_application(application, registry: MetricsRegistry = REGISTRY):
+    """Instrument every handler registered on the application so far"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler, registry)
+
+class InstrumentedRequest(BaseRequest):
+    """Bot API transport wrapper that records the count and duration of every call"""
+
+    def __init__(self, request: BaseRequest, registry: MetricsRegistry = REGISTRY):
+        self.request = request
+        self.registry = registry
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        start = time.perf_counter()
+        status = 0
+        try:
+            status, payload = await self.request.do_request(url, method, request_data, *args, **kwargs)
+            return status, payload
+        finally:
+            self.registry.observe_api_call(
+                url.rsplit('/', 1)[-1], time.perf_counter() - start, error=not 200 <= status < 300
+            )
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show handler and Bot API metrics; `/metrics prometheus` sends the raw exposition text"""
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    if context.args and context.args[0] == 'reset':
+        REGISTRY.reset()
+        await update.message.reply_text("Metrics reset.")
+        return
+
+    if context.args and context.args[0] == 'prometheus':
+        await update.message.reply_document(
+            document=io.BytesIO(REGISTRY.render_prometheus().encode()),
+            filename="metrics.prom"
+        )
+        return
+
+    uptime = int(time.time() - REGISTRY.started)
+    text = f"Metrics for the last {uptime // 3600}h {uptime % 3600 // 60}m\n\n{REGISTRY.render_table()}"
+    if len(text) > 4000:
+        await update.message.reply_document(document=io.BytesIO(text.encode()), filename="metrics.txt")
+    else:
+        await update.message.reply_text(f"<pre>{html.escape(text)}</pre>", parse_mode='HTML')
+
+def register_metrics_handlers(application):
+    application.add_handler(CommandHandler('metrics', metrics_command))
@@ -1,12 +1,121 @@
 from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from database.store import Store
+from handlers.broadcast import get_broadcaster
 import uuid
 import os
 import json
 import hmac
 import hashlib
+import time
+import heapq
+from collections import OrderedDict
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+class PaymentLinkRegistry:
+    """Payment links keyed by payment_id with expiry, a size cap and an order_id index.
+
+    Entries are kept in least-recently-used order. When the cap is exceeded, the
+    earliest completed entry is evicted first, then the earliest expired one; live
+    pending links are only evicted, least recently used first, if nothing else is left.
+    Each eviction takes constant time, or logarithmic when it pops the expiry heap.
+    """
+
+    def __init__(self, ttl: float = 3 * 3600, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.links: "OrderedDict[str, dict]" = OrderedDict()
+        self.by_order: Dict[int, str] = {}  # order_id: payment_id of its live link
+        self._expiry: List[Tuple[float, str]] = []  # (expires_at, payment_id) heap for purge_expired
+        self._completed: "OrderedDict[str, None]" = OrderedDict()  # payment_ids of completed links, in completion order
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_expiry' not in state:
+            # Registries pickled before the expiry heap existed
+            self._expiry = [(info['expires_at'], payment_id) for payment_id, info in self.links.items()]
+            heapq.heapify(self._expiry)
+        if '_completed' not in state:
+            self._completed = OrderedDict(
+                (payment_id, None) for payment_id, info in self.links.items() if info['status'] == 'completed'
+            )
+
+    def __len__(self):
+        return len(self.links)
+
+    def _is_live(self, info: dict, now: float) -> bool:
+        return info['status'] == 'pending' and info['expires_at'] > now
+
+    def add(self, payment_id: str, info: dict) -> dict:
+        now = time.time()
+        info.setdefault('expires_at', now + self.ttl)
+        self.links[payment_id] = info
+        self._completed.pop(payment_id, None)
+        self.by_order[info['order_id']] = payment_id
+        heapq.heappush(self._expiry, (info['expires_at'], payment_id))
+        while len(self.links) > self.max_size:
+            self._evict_one(now)
+        return info
+
+    def _evict_one(self, now: float):
+        if self._completed:
+            self.remove(next(iter(self._completed)))
+            return
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, payment_id = heapq.heappop(self._expiry)
+            info = self.links.get(payment_id)
+            # Entries of links removed or re-added since are skipped
+            if info is not None and info['expires_at'] == expires_at:
+                self.remove(payment_id)
+                return
+        self.remove(next(iter(self.links)))
+
+    def get(self, payment_id: str) -> Optional[dict]:
+        info = self.links.get(payment_id)
+        if info is not None:
+            self.links.move_to_end(payment_id)
+        return info
+
+    def get_live_for_order(self, order_id: int) -> Optional[dict]:
+        """Return the order's pending, unexpired link if there is one"""
+        payment_id = self.by_order.get(order_id)
+        if payment_id is None:
+            return None
+        info = self.get(payment_id)
+        if info is None or not self._is_live(info, time.time()):
+            return None
+        return info
+
+    def complete(self, payment_id: str):
+        info = self.links.get(payment_id)
+        if info is not None:
+            info['status'] = 'completed'
+            self._completed[payment_id] = None
+            if self.by_order.get(info['order_id']) == payment_id:
+                del self.by_order[info['order_id']]
+
+    def remove(self, payment_id: str):
+        info = self.links.pop(payment_id, None)
+        self._completed.pop(payment_id, None)
+        if info is not None and self.by_order.get(info['order_id']) == payment_id:
+            del self.by_order[info['order_id']]
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Drop links past their expiry, paid or not; returns how many were removed.
+
+        Cost is proportional to the number of links that expired.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, payment_id = heapq.heappop(self._expiry)
+            info = self.links.get(payment_id)
+            # Links evicted or re-added since are skipped
+            if info is not None and info['expires_at'] == expires_at:
+                self.remove(payment_id)
+                removed += 1
+        return removed
 
 class PayPalHandler:
     def __init__(self):
@@ -14,22 +123,43 @@ class PayPalHandler:
         self.client_secret = os.getenv('PAYPAL_CLIENT_SECRET')
         self.webhook_id = os.getenv('PAYPAL_WEBHOOK_ID')
         self.base_url = "https://api-m.paypal.com" if os.getenv('PAYPAL_MODE') == 'live' else "https://api-m.sandbox.paypal.com"
-        self.payment_links = {}  # Store payment links with order info
+        self.payment_links = PaymentLinkRegistry(
+            ttl=float(os.getenv('PAYPAL_LINK_TTL', 3 * 3600)),
+            max_size=int(os.getenv('PAYPAL_LINK_LIMIT', 10000))
+        )  # Store payment links with order info
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if isinstance(self.payment_links, dict):
+            # Handlers pickled before the registry existed kept a plain, unbounded dict
+            links = self.payment_links
+            self.payment_links = PaymentLinkRegistry()
+            for payment_id, info in links.items():
+                created_at = datetime.fromisoformat(info['created_at']).timestamp()
+                info['expires_at'] = created_at + self.payment_links.ttl
+                info['link'] = f"{self.base_url}/checkout/pay/{payment_id}"
+                self.payment_links.add(payment_id, info)
+            self.payment_links.purge_expired()
 
     def generate_payment_link(self, order_id: int, amount: float, description: str) -> str:
-        """Generate a PayPal payment link for the order"""
+        """Generate a PayPal payment link for the order, reusing a live one if it exists"""
+        existing = self.payment_links.get_live_for_order(order_id)
+        if existing is not None and existing['amount'] == amount:
+            return existing['link']
+
         # In a real implementation, you would use PayPal's API to create a payment link
         # This is a simplified example
         payment_id = str(uuid.uuid4())
         payment_link = f"{self.base_url}/checkout/pay/{payment_id}"
         
         # Store payment information for verification
-        self.payment_links[payment_id] = {
+        self.payment_links.add(payment_id, {
             'order_id': order_id,
             'amount': amount,
             'status': 'pending',
+            'link': payment_link,
             'created_at': datetime.now().isoformat()
-        }
+        })
         
         return payment_link
 
@@ -43,6 +173,8 @@ class PayPalHandler:
         transmission_id = headers.get('PAYPAL-TRANSMISSION-ID')
         transmission_sig = headers.get('PAYPAL-TRANSMISSION-SIG')
         transmission_time = headers.get('PAYPAL-TRANSMISSION-TIME')
+        if not transmission_sig:
+            return False
 
         # Verify webhook signature using PayPal's algorithm
         # This is a simplified example - in production, implement full signature verification
@@ -83,24 +215,24 @@ async def paypal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Your order will be confirmed automatically once the payment is completed."
     )
 
-async def handle_paypal_webhook(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle PayPal webhook notifications"""
-    store: Store = context.bot_data['store']
-    paypal_handler = context.bot_data.get('paypal_handler')
+async def handle_paypal_webhook(application, body: str, headers: dict) -> bool:
+    """Handle a PayPal webhook notification delivered over HTTP (see webhook_server.py).
+
+    ``headers`` must use upper-case names. Returns False if the signature is invalid.
+    """
+    store: Store = application.bot_data['store']
+    paypal_handler = application.bot_data.get('paypal_handler')
     
     if not paypal_handler:
-        return
+        return False
     
     # Verify webhook signature
-    if not paypal_handler.verify_webhook_signature(
-        update.message.text,
-        update.message.json.get('headers', {})
-    ):
-        return
+    if not paypal_handler.verify_webhook_signature(body, headers):
+        return False
 
     try:
         # Parse webhook payload
-        payload = json.loads(update.message.text)
+        payload = json.loads(body)
         event_type = payload.get('event_type')
         
         if event_type == 'PAYMENT.CAPTURE.COMPLETED':
@@ -114,29 +246,30 @@ async def handle_paypal_webhook(update: Update, context: ContextTypes.DEFAULT_TY
                 # Complete the order
                 if store.complete_order(order_id):
                     # Get customer ID from order
-                    order = next((o for o in store.orders if o.id == order_id), None)
+                    order = store.get_order(order_id)
                     if order:
                         # Notify customer
-                        await context.bot.send_message(
+                        await application.bot.send_message(
                             chat_id=order.customer_id,
                             text="🎉 Your payment has been completed! Thank you for your purchase."
                         )
                         
                         # Notify admins
-                        for admin_id in context.bot_data.get('admins', []):
-                            await context.bot.send_message(
-                                chat_id=admin_id,
-                                text=f"💰 New payment received for Order #{order_id}\n"
-                                     f"Amount: ${payment_info['amount']:.2f}"
-                            )
+                        get_broadcaster(application).submit(
+                            application.bot_data.get('admins', []),
+                            f"💰 New payment received for Order #{order_id}\n"
+                            f"Amount: ${payment_info['amount']:.2f}"
+                        )
                         
                         # Update payment status
-                        payment_info['status'] = 'completed'
+                        paypal_handler.payment_links.complete(payment_id)
                 
     except Exception as e:
         # Log the error in a production environment
         print(f"Error processing PayPal webhook: {str(e)}")
 
+    return True
+
 def register_payment_handlers(application):
     """Register payment-related handlers"""
     application.add_handler(CommandHandler('paypal', paypal_command))
\ No newline at end of file
@@ -0,0 +1,155 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from database.store import Order, Product, Store
+from handlers.callbacks import encode_callback, ADD_TO_CART, CHECKOUT, NOTIFY_RESTOCK, PRODUCTS_PAGE
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import weakref
+
+RECEIPT_CACHE_SIZE = 10000
+CART_CACHE_SIZE = 10000
+
+def product_caption(product: Product) -> str:
+    return f"""
+{product.name}
+Description: {product.description}
+Price: ${product.price:.2f}
+Stock: {product.stock if product.stock > 0 else "Sold out"}
+"""
+
+def product_button(product: Product) -> InlineKeyboardButton:
+    """Add to Cart, or for a sold-out product, a button to be told when it is back"""
+    if product.stock > 0:
+        return InlineKeyboardButton(f"Add to Cart: {product.name}", callback_data=encode_callback(ADD_TO_CART, product.id))
+    return InlineKeyboardButton(f"🔔 Notify me: {product.name}", callback_data=encode_callback(NOTIFY_RESTOCK, product.id))
+
+def render_receipt(store: Store, order: Order) -> str:
+    lines = [f"Receipt for order #{order.id}", f"Date: {order.date:%Y-%m-%d %H:%M}", f"Status: {order.status}", ""]
+    for product_id, quantity in order.line_items():
+        product = store.products.get(product_id)
+        lines.append(f"{product.name if product else f'Product #{product_id}'} x{quantity}")
+    lines.append(f"\nTotal: ${order.total:.2f}")
+    return "\n".join(lines)
+
+class RenderCache:
+    """Prebuilt captions, media and keyboards for one store.
+
+    Entries are tagged with the version of the product or customer they were built
+    from (``Store.product_versions`` / ``customer_versions``) and rebuilt only once
+    that version moves on. Entries of deleted products and of pages past the end of
+    the catalog are dropped by ``prune``. Receipts of completed orders never change
+    and are kept in a bounded LRU. Rendered carts are kept in one too, so carts
+    emptied by a checkout or by the maintenance sweep do not stay cached for good.
+    Telegram objects are immutable, so cached ones are safe to send any number of
+    times.
+    """
+
+    def __init__(self, store: Store):
+        # A proxy, so the cache does not keep its store alive
+        self.store = weakref.proxy(store)
+        self.products: Dict[int, Tuple[int, str, InputMediaPhoto, InlineKeyboardButton]] = {}
+        self.pages: Dict[Tuple[int, int], Tuple[tuple, InlineKeyboardMarkup, str]] = {}
+        self.carts: "OrderedDict[int, Tuple[int, tuple, str, InlineKeyboardMarkup]]" = OrderedDict()
+        self.receipts: "OrderedDict[int, str]" = OrderedDict()
+
+    def _product(self, product: Product):
+        version = self.store.product_versions.get(product.id, 0)
+        entry = self.products.get(product.id)
+        if entry is None or entry[0] != version:
+            caption = product_caption(product)
+            entry = self.products[product.id] = (
+                version,
+                caption,
+                InputMediaPhoto(media=product.photo_file_id or product.image_url, caption=caption),
+                product_button(product),
+            )
+        return entry
+
+    def caption(self, product: Product) -> str:
+        return self._product(product)[1]
+
+    def media(self, product: Product) -> InputMediaPhoto:
+        return self._product(product)[2]
+
+    def product_button(self, product: Product) -> InlineKeyboardButton:
+        return self._product(product)[3]
+
+    def page_keyboard(self, products: List[Product], page: int, page_size: int) -> Tuple[InlineKeyboardMarkup, str]:
+        """Keyboard and "Page x of y" text for one catalog page"""
+        total = len(self.store.products)
+        key = (page, page_size)
+        # The page depends on which products are on it, their versions and the page count
+        tag = (total, tuple((product.id, self.store.product_versions.get(product.id, 0)) for product in products))
+        entry = self.pages.get(key)
+        if entry is None or entry[0] != tag:
+            keyboard = [[self.product_button(product)] for product in products]
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton("◀ Previous", callback_data=encode_callback(PRODUCTS_PAGE, page - 1)))
+            if (page + 1) * page_size < total:
+                navigation.append(InlineKeyboardButton("Next ▶", callback_data=encode_callback(PRODUCTS_PAGE, page + 1)))
+            if navigation:
+                keyboard.append(navigation)
+            total_pages = (total + page_size - 1) // page_size
+            entry = self.pages[key] = (tag, InlineKeyboardMarkup(keyboard), f"Page {page + 1} of {total_pages}")
+        return entry[1], entry[2]
+
+    def cart(self, customer_id: int) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+        """Cart summary and checkout keyboard, or None if the cart is empty"""
+        customer = self.store.customers.get(customer_id)
+        if customer is None or not customer.cart:
+            self.carts.pop(customer_id, None)
+            return None
+        version = self.store.customer_versions.get(customer_id, 0)
+        # Names and prices come from the products, so their versions count too
+        product_versions = tuple(self.store.product_versions.get(pid, 0) for pid in customer.cart)
+        entry = self.carts.get(customer_id)
+        if entry is None or entry[0] != version or entry[1] != product_versions:
+            cart_items = []
+            total = 0
+            for product_id, quantity in customer.cart.items():
+                product = self.store.products.get(product_id)
+                if product is None:
+                    cart_items.append(f"Product #{product_id} x{quantity} - no longer available")
+                    continue
+                subtotal = product.price * quantity
+                total += subtotal
+                cart_items.append(f"{product.name} x{quantity} - ${subtotal:.2f}")
+            text = "\n".join(cart_items) + f"\n\nTotal: ${total:.2f}"
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("Checkout", callback_data=encode_callback(CHECKOUT))]])
+            entry = self.carts[customer_id] = (version, product_versions, text, markup)
+            if len(self.carts) > CART_CACHE_SIZE:
+                self.carts.popitem(last=False)
+        self.carts.move_to_end(customer_id)
+        return entry[2], entry[3]
+
+    def prune(self) -> int:
+        """Drop entries of deleted products and of pages past the end of the catalog; returns how many"""
+        products = self.store.products
+        total = len(products)
+        stale_products = [product_id for product_id in self.products if product_id not in products]
+        for product_id in stale_products:
+            del self.products[product_id]
+        stale_pages = [key for key in self.pages if key[0] * key[1] >= total]
+        for key in stale_pages:
+            del self.pages[key]
+        return len(stale_products) + len(stale_pages)
+
+    def receipt(self, order: Order) -> str:
+        if order.status != "completed":
+            return render_receipt(self.store, order)
+        receipt = self.receipts.get(order.id)
+        if receipt is None:
+            receipt = self.receipts[order.id] = render_receipt(self.store, order)
+            if len(self.receipts) > RECEIPT_CACHE_SIZE:
+                self.receipts.popitem(last=False)
+        else:
+            self.receipts.move_to_end(order.id)
+        return receipt
+
+_caches: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def get_render_cache(store: Store) -> RenderCache:
+    cache: Optional[RenderCache] = _caches.get(store)
+    if cache is None:
+        cache = _caches[store] = RenderCache(store)
+    return cache
@@ -0,0 +1,101 @@
+from telegram import Update
+from telegram.ext import ContextTypes, CommandHandler
+from database.analytics import get_sales_ledger, DAY
+from database.store import Store
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+import csv
+import io
+
+REPORT_TOP_PRODUCTS = 10
+REPORT_DAYS_SHOWN = 14  # most recent days listed in the chat; the CSV has all of them
+
+USAGE = """Usage: /report [from] [to] [csv]
+Dates are YYYY-MM-DD in UTC; both ends are included. Examples:
+/report
+/report 2024-01-01 2024-01-31
+/report 2024-03-01 csv"""
+
+def parse_report_args(args: List[str]) -> Tuple[Optional[int], Optional[int], bool]:
+    """(start, end) as epoch seconds with ``end`` exclusive, and whether CSV was asked for"""
+    args = list(args)
+    as_csv = bool(args) and args[-1].lower() == 'csv'
+    if as_csv:
+        args.pop()
+    if len(args) > 2:
+        raise ValueError("too many arguments")
+    days = [int(datetime.strptime(arg, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()) for arg in args]
+    start = days[0] if days else None
+    end = days[1] + DAY if len(days) > 1 else None
+    if start is not None and end is not None and end <= start:
+        raise ValueError("the end date is before the start date")
+    return start, end, as_csv
+
+def _day(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+def _product_name(store: Store, product_id: int) -> str:
+    product = store.products.get(product_id)
+    return product.name if product else f"Product #{product_id}"
+
+def render_report(store: Store, report: dict, start: Optional[int], end: Optional[int]) -> str:
+    period = f"{_day(start) if start is not None else 'first order'} to {_day(end - DAY) if end is not None else 'today'}"
+    lines = [
+        f"📈 Sales report, {period}",
+        f"Revenue: ${report['revenue']:.2f}",
+        f"Orders: {report['orders']} (average ${report['average_order_value']:.2f})",
+        f"Units sold: {report['units']}",
+        f"Customers: {report['customers']} ({report['repeat_customer_rate']:.0%} ordered more than once)",
+    ]
+    if report['top_products']:
+        lines.append("\nTop products:")
+        for rank, (product_id, units, revenue) in enumerate(report['top_products'], 1):
+            lines.append(f"{rank}. {_product_name(store, product_id)}: ${revenue:.2f} ({units} units)")
+    if report['daily']:
+        lines.append("\nRevenue per day:")
+        for day, orders, revenue in report['daily'][-REPORT_DAYS_SHOWN:]:
+            lines.append(f"{_day(day)}: ${revenue:.2f} ({orders} orders)")
+    return "\n".join(lines)
+
+def _csv_document(header: Tuple[str, ...], rows) -> io.BytesIO:
+    text = io.StringIO(newline='')
+    writer = csv.writer(text)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return io.BytesIO(text.getvalue().encode('utf-8'))
+
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    try:
+        start, end, as_csv = parse_report_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"Invalid report range: {e}\n\n{USAGE}")
+        return
+
+    store: Store = context.bot_data['store']
+    ledger = get_sales_ledger(store)
+    await ledger.load_archive()
+    ledger.refresh()
+    report = ledger.report(start, end, REPORT_TOP_PRODUCTS)
+    await update.message.reply_text(render_report(store, report, start, end))
+
+    if as_csv:
+        await update.message.reply_document(
+            document=_csv_document(('product_id', 'name', 'units', 'revenue'), (
+                (product_id, _product_name(store, product_id), units, f"{revenue:.2f}")
+                for product_id, units, revenue in report['products']
+            )),
+            filename="sales_by_product.csv"
+        )
+        await update.message.reply_document(
+            document=_csv_document(('date', 'orders', 'revenue'), (
+                (_day(day), orders, f"{revenue:.2f}") for day, orders, revenue in report['daily']
+            )),
+            filename="sales_by_day.csv"
+        )
+
+def register_report_handlers(application):
+    application.add_handler(CommandHandler('report', report_command))
@@ -0,0 +1,81 @@
+from telegram import Update, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CommandHandler
+from database.store import Product, Store
+from handlers.broadcast import get_broadcaster
+from handlers.callbacks import get_callback_router, NOTIFY_RESTOCK
+from handlers.render import get_render_cache
+from typing import Dict, List
+import os
+
+LOW_STOCK_THRESHOLD = int(os.getenv('LOW_STOCK_THRESHOLD', '5'))  # admins are alerted at or below this
+LOW_STOCK_ALERTS_PER_SWEEP = 50
+RESTOCK_NOTIFICATIONS_PER_SWEEP = int(os.getenv('RESTOCK_NOTIFICATIONS_PER_SWEEP', '200'))
+LOW_STOCK_LIST_LIMIT = 30  # products listed by /low_stock
+
+def _stock_line(product: Product) -> str:
+    stock = f"{product.stock} left" if product.stock > 0 else "sold out"
+    return f"#{product.id} {product.name}: {stock}"
+
+def render_low_stock_alert(products: List[Product]) -> str:
+    return "⚠️ Low stock:\n" + "\n".join(_stock_line(product) for product in products)
+
+async def run_stock_alerts(application) -> Dict[str, int]:
+    """Alert admins about products that went low and tell subscribers about restocked ones.
+
+    Both come from store indexes, so nothing is scanned. Alerts are deduplicated by the
+    product's low_stock_alerted flag; restock notifications go out in batches of at most
+    RESTOCK_NOTIFICATIONS_PER_SWEEP, through the rate-limited broadcaster.
+    """
+    store: Store = application.bot_data['store']
+    broadcaster = get_broadcaster(application)
+
+    low = store.take_low_stock_alerts(LOW_STOCK_THRESHOLD, LOW_STOCK_ALERTS_PER_SWEEP)
+    admins = application.bot_data.get('admins', [])
+    if low and admins:
+        broadcaster.submit(admins, render_low_stock_alert(low))
+
+    notified = 0
+    cache = get_render_cache(store)
+    for product, customer_ids in store.take_restock_notifications(RESTOCK_NOTIFICATIONS_PER_SWEEP):
+        broadcaster.submit(customer_ids, f"🔔 {product.name} is back in stock!",
+                           reply_markup=InlineKeyboardMarkup([[cache.product_button(product)]]))
+        notified += len(customer_ids)
+    return {'low_stock_alerts': len(low), 'restock_notifications': notified}
+
+async def handle_notify_restock(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    store: Store = context.bot_data['store']
+
+    product_id = context.args[0]
+    if store.subscribe_restock(query.from_user.id, product_id):
+        await query.answer("We'll let you know when it is back in stock.")
+    elif store.get_product(product_id) is not None:
+        await query.answer("It is back in stock, you can add it to your cart now.")
+    else:
+        await query.answer("This product is no longer available.")
+
+async def low_stock_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    try:
+        threshold = int(context.args[0]) if context.args else LOW_STOCK_THRESHOLD
+    except ValueError:
+        await update.message.reply_text("Usage: /low_stock [threshold]")
+        return
+
+    store: Store = context.bot_data['store']
+    products = store.low_stock_products(threshold, LOW_STOCK_LIST_LIMIT + 1)
+    if not products:
+        await update.message.reply_text(f"No products with {threshold} or fewer in stock.")
+        return
+    lines = [f"Products with {threshold} or fewer in stock ({store.sold_out_count()} sold out):"]
+    lines += [_stock_line(product) for product in products[:LOW_STOCK_LIST_LIMIT]]
+    if len(products) > LOW_STOCK_LIST_LIMIT:
+        lines.append("...")
+    await update.message.reply_text("\n".join(lines))
+
+def register_stock_handlers(application):
+    application.add_handler(CommandHandler('low_stock', low_stock_command))
+    get_callback_router(application).add(NOTIFY_RESTOCK, handle_notify_restock, (int,))
@@ -1,78 +1,198 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 from database.store import Store
+from handlers.broadcast import get_broadcaster
+from handlers.callbacks import get_callback_router, encode_callback, SUPPORT_ACCEPT
+from typing import Optional
+import os
+import re
+
+# 'least_loaded' or 'round_robin' connect waiting users to admins automatically;
+# 'manual' only offers each request to the admins with an Accept button
+SUPPORT_ASSIGNMENT = os.getenv('SUPPORT_ASSIGNMENT', 'least_loaded')
+# Sessions an admin is given automatically before new users have to wait
+SUPPORT_MAX_SESSIONS = int(os.getenv('SUPPORT_MAX_SESSIONS', '3'))
+# Relayed messages are tagged so admins can pick a session by replying to them
+USER_TAG = "[user {}]"
+USER_TAG_PATTERN = re.compile(r"^\[user (\d+)\]")
+QUEUE_LIST_LIMIT = 20
+
+async def _notify_connected(context: ContextTypes.DEFAULT_TYPE, user_id: int, admin_id: int):
+    await context.bot.send_message(
+        chat_id=user_id,
+        text="An administrator has accepted your support request. You can now communicate directly."
+    )
+    await context.bot.send_message(
+        chat_id=admin_id,
+        text=f"You are now connected with user {user_id}. Messages you send here are relayed to them; "
+             "with several open sessions, reply to one of their messages to choose who gets yours. "
+             f"Use /end_support {user_id} to close the session."
+    )
+
+async def assign_waiting_users(context: ContextTypes.DEFAULT_TYPE):
+    """Hand queued users to admins with spare capacity, per SUPPORT_ASSIGNMENT"""
+    if SUPPORT_ASSIGNMENT == 'manual':
+        return
+    store: Store = context.bot_data['store']
+    admins = context.bot_data.get('admins', [])
+    while True:
+        assigned = store.assign_support(admins, SUPPORT_MAX_SESSIONS, SUPPORT_ASSIGNMENT)
+        if assigned is None:
+            break
+        await _notify_connected(context, *assigned)
 
 async def request_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store: Store = context.bot_data['store']
     user_id = update.effective_user.id
-    
-    if user_id in store.support_queue:
-        await update.message.reply_text("You are already in the support queue.")
+
+    position = store.support_queue.position(user_id)
+    if position is not None:
+        await update.message.reply_text(f"You are already in the support queue, at position {position}.")
         return
-    
+
     if user_id in store.active_support_sessions:
         await update.message.reply_text("You are already in an active support session.")
         return
-    
-    store.support_queue.append(user_id)
+
+    position = store.enqueue_support(user_id)
+    await assign_waiting_users(context)
+    if user_id in store.active_support_sessions:
+        return
+
     await update.message.reply_text(
-        "You have been added to the support queue. "
-        "An administrator will be with you shortly."
+        f"You have been added to the support queue at position {position}. "
+        "An administrator will be with you shortly. Use /end_support to leave the queue."
     )
-    
-    # Notify all admins
-    for admin_id in context.bot_data.get('admins', []):
-        keyboard = [[
-            InlineKeyboardButton(
-                "Accept Request",
-                callback_data=f"support_accept_{user_id}"
-            )
-        ]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await context.bot.send_message(
-            chat_id=admin_id,
-            text=f"New support request from user {user_id}",
-            reply_markup=reply_markup
+
+    # Notify all admins without waiting for delivery
+    keyboard = [[
+        InlineKeyboardButton(
+            "Accept Request",
+            callback_data=encode_callback(SUPPORT_ACCEPT, user_id)
         )
+    ]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
 
-async def handle_support_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    get_broadcaster(context.application).submit(
+        context.bot_data.get('admins', []),
+        f"New support request from user {user_id} ({len(store.support_queue)} waiting)",
+        reply_markup=reply_markup
+    )
+
+async def handle_support_accept(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     store: Store = context.bot_data['store']
-    
-    if query.data.startswith("support_accept_"):
-        user_id = int(query.data.split("_")[-1])
-        admin_id = query.from_user.id
-        
-        if user_id in store.support_queue:
-            store.support_queue.remove(user_id)
-            store.active_support_sessions[user_id] = admin_id
-            
-            await context.bot.send_message(
-                chat_id=user_id,
-                text="An administrator has accepted your support request. You can now communicate directly."
-            )
-            await query.message.reply_text(f"You are now connected with user {user_id}")
-        else:
-            await query.message.reply_text("This support request is no longer valid.")
+
+    await query.answer()
+    user_id = context.args[0]
+    admin_id = query.from_user.id
+
+    if store.start_support_session(user_id, admin_id):
+        await _notify_connected(context, user_id, admin_id)
+    else:
+        await query.message.reply_text("This support request is no longer valid.")
+
+def _admin_session_target(store: Store, admin_id: int, args) -> Optional[int]:
+    sessions = store.get_admin_sessions(admin_id)
+    if args and args[0].isdigit():
+        user_id = int(args[0])
+        return user_id if user_id in sessions else None
+    return next(iter(sessions)) if len(sessions) == 1 else None
 
 async def end_support(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store: Store = context.bot_data['store']
     user_id = update.effective_user.id
-    
-    if user_id in store.active_support_sessions:
-        admin_id = store.active_support_sessions[user_id]
-        del store.active_support_sessions[user_id]
-        
+
+    if store.leave_support_queue(user_id):
+        await update.message.reply_text("You have left the support queue.")
+        return
+
+    admin_id = store.end_support_session(user_id)
+    if admin_id is not None:
         await update.message.reply_text("Support session ended.")
         await context.bot.send_message(
             chat_id=admin_id,
             text=f"Support session with user {user_id} has ended."
         )
+    elif store.get_admin_sessions(user_id):
+        # An admin closing one of their sessions
+        target = _admin_session_target(store, user_id, context.args)
+        if target is None:
+            await update.message.reply_text(
+                "Usage: /end_support <user_id>\nOpen sessions: "
+                + ", ".join(map(str, sorted(store.get_admin_sessions(user_id))))
+            )
+            return
+        store.end_support_session(target)
+        await update.message.reply_text(f"Support session with user {target} ended.")
+        await context.bot.send_message(chat_id=target, text="The administrator has ended the support session.")
     else:
         await update.message.reply_text("You are not in an active support session.")
+        return
+
+    # The admin has a free slot now
+    await assign_waiting_users(context)
+
+def _tagged_user(message: Optional[Message]) -> Optional[int]:
+    if message is None:
+        return None
+    match = USER_TAG_PATTERN.match(message.text or message.caption or '')
+    return int(match.group(1)) if match else None
+
+async def relay_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Forward messages between the two sides of an active support session"""
+    store: Store = context.bot_data['store']
+    message = update.effective_message
+    sender_id = update.effective_user.id
+
+    admin_id = store.active_support_sessions.get(sender_id)
+    if admin_id is not None:
+        tag = USER_TAG.format(sender_id)
+        if message.text is not None:
+            await context.bot.send_message(chat_id=admin_id, text=f"{tag} {message.text}")
+        else:
+            header = await context.bot.send_message(chat_id=admin_id, text=tag)
+            await message.copy(chat_id=admin_id, reply_to_message_id=header.message_id)
+        return
+
+    sessions = store.get_admin_sessions(sender_id)
+    if not sessions:
+        return
+    target = _tagged_user(message.reply_to_message)
+    if target not in sessions:
+        if len(sessions) != 1:
+            await message.reply_text("You have several open sessions; reply to a user's message to answer them.")
+            return
+        target = next(iter(sessions))
+    await message.copy(chat_id=target)
+
+async def support_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    store: Store = context.bot_data['store']
+    lines = [f"Waiting: {len(store.support_queue)}"]
+    for position, user_id in enumerate(store.support_queue, 1):
+        if position > QUEUE_LIST_LIMIT:
+            lines.append(f"... and {len(store.support_queue) - QUEUE_LIST_LIMIT} more")
+            break
+        lines.append(f"{position}. user {user_id}")
+    lines.append(f"\nActive sessions: {len(store.active_support_sessions)}")
+    for admin_id, users in sorted(store.admin_sessions.items()):
+        lines.append(f"admin {admin_id}: {', '.join(map(str, sorted(users)))}")
+    await update.message.reply_text("\n".join(lines))
 
 def register_support_handlers(application):
     application.add_handler(CommandHandler('support', request_support))
     application.add_handler(CommandHandler('end_support', end_support))
-    application.add_handler(CallbackQueryHandler(handle_support_callback))
\ No newline at end of file
+    application.add_handler(CommandHandler('support_requests', support_requests))
+    # Same group as, and registered after, the /add_product and /import_products
+    # conversations: a message one of them takes is never relayed as well
+    application.add_handler(
+        MessageHandler(
+            filters.ChatType.PRIVATE & ~filters.COMMAND & ~filters.StatusUpdate.ALL & ~filters.SUCCESSFUL_PAYMENT,
+            relay_message
+        )
+    )
+    get_callback_router(application).add(SUPPORT_ACCEPT, handle_support_accept, (int,))
@@ -0,0 +1,132 @@
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, BaseHandler, ContextTypes, filters
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import os
+import time
+import weakref
+
+# Sustained updates per second allowed per user, and the burst allowed on top;
+# payments and service messages never count (see _user_initiated)
+THROTTLE_RATE = float(os.getenv('THROTTLE_RATE', '2'))
+THROTTLE_BURST = float(os.getenv('THROTTLE_BURST', '10'))
+# Seconds during which repeated taps on the same button are merged
+TAP_WINDOW = float(os.getenv('TAP_WINDOW', '0.5'))
+
+class UserThrottle:
+    """Per-user token buckets: ``rate`` updates per second with bursts of up to ``burst``.
+
+    A bucket is a (tokens, updated) tuple. Buckets that have refilled completely carry
+    no information and are dropped once more than ``max_users`` are tracked.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: float = THROTTLE_BURST, max_users: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._prune_at = max_users
+        self.buckets: Dict[int, Tuple[float, float]] = {}
+
+    def allow(self, user_id: int, now: Optional[float] = None) -> bool:
+        """Take one token from the user's bucket; False if it is empty"""
+        if now is None:
+            now = time.monotonic()
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            tokens = self.burst
+            if len(self.buckets) >= self._prune_at:
+                self._prune(now)
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        if tokens < 1:
+            self.buckets[user_id] = (tokens, now)
+            return False
+        self.buckets[user_id] = (tokens - 1, now)
+        return True
+
+    def _prune(self, now: float):
+        self.buckets = {user_id: (tokens, updated) for user_id, (tokens, updated) in self.buckets.items()
+                        if tokens + (now - updated) * self.rate < self.burst}
+        # If most users are still active, wait for the table to double before scanning again
+        self._prune_at = max(self.max_users, 2 * len(self.buckets))
+
+def _user_initiated(update: Update) -> bool:
+    """Taps, inline queries and any message a user sent; never payments or service messages"""
+    if update.callback_query is not None or update.inline_query is not None:
+        return True
+    message = update.message or update.edited_message
+    if message is None:
+        return False
+    return (message.successful_payment is None and message.refunded_payment is None
+            and not filters.StatusUpdate.ALL.check_update(update))
+
+class ThrottleHandler(BaseHandler[Update, ContextTypes.DEFAULT_TYPE, None]):
+    """Matches user-initiated updates from users who are over their rate, except ``exempt`` ones.
+
+    The check runs before any context is built, so updates within the rate cost one
+    bucket lookup; the callback stops the flood before any other handler sees it.
+    Pre-checkout queries and successful payments are never matched, and do not take
+    tokens either: dropping them would lose a payment that was already made.
+    """
+
+    def __init__(self, callback, throttle: UserThrottle, exempt: Callable[[int], bool] = lambda user_id: False):
+        super().__init__(callback)
+        self.throttle = throttle
+        self.exempt = exempt
+
+    def check_update(self, update: object) -> bool:
+        if not isinstance(update, Update) or update.effective_user is None or not _user_initiated(update):
+            return False
+        user_id = update.effective_user.id
+        return not self.throttle.allow(user_id) and not self.exempt(user_id)
+
+async def drop_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Drop a throttled update; unanswered callback queries simply stop spinning"""
+    raise ApplicationHandlerStop
+
+class TapCoalescer:
+    """Merges repeated taps on one button into a single action.
+
+    The first tap is handled at once by the caller and opens a window of ``window``
+    seconds. Taps with the same key during the window are only counted; when it
+    closes, ``flush(latest, count)`` runs once for all of them and, if there were
+    any, a new window opens.
+    """
+
+    def __init__(self, application, window: float = TAP_WINDOW):
+        self.application = application
+        self.window = window
+        self.pending: Dict[Hashable, List] = {}  # key: [count, latest tap, flush]
+
+    def tap(self, key: Hashable, latest, flush: Callable[[object, int], Awaitable]) -> bool:
+        """Record a tap; True if it opened a window and the caller should handle it now"""
+        entry = self.pending.get(key)
+        if entry is not None:
+            entry[0] += 1
+            entry[1] = latest
+            entry[2] = flush
+            return False
+        self.pending[key] = [0, None, flush]
+        asyncio.get_running_loop().call_later(self.window, self._close, key)
+        return True
+
+    def _close(self, key: Hashable):
+        count, latest, flush = self.pending.pop(key)
+        if count:
+            self.pending[key] = [0, None, flush]
+            asyncio.get_running_loop().call_later(self.window, self._close, key)
+            self.application.create_task(flush(latest, count))
+
+_coalescers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def get_tap_coalescer(application) -> TapCoalescer:
+    """Return the application's TapCoalescer, creating it on first use"""
+    coalescer: Optional[TapCoalescer] = _coalescers.get(application)
+    if coalescer is None:
+        coalescer = _coalescers[application] = TapCoalescer(application)
+    return coalescer
+
+def register_throttle_handlers(application):
+    # Runs before every other group, including the worker store sync; admins are never throttled
+    exempt = lambda user_id: user_id in application.bot_data.get('admins', [])
+    application.add_handler(ThrottleHandler(drop_update, UserThrottle(), exempt), group=-2)
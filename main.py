@@ -1,14 +1,30 @@
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, PicklePersistence
+import time
+# Cold start timing starts before the imports, which are much of it (see post_init)
+STARTED_AT = time.perf_counter()
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, MessageHandler, TypeHandler, filters
 from dotenv import load_dotenv
 import os
 import logging
 import sys
-import subprocess
-from handlers.admin import register_admin_handlers
-from handlers.customer import register_customer_handlers
-from handlers.support import register_support_handlers
-from handlers.payments import register_payment_handlers
+import io
+import asyncio
+import signal
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest
+from telegram.request import HTTPXRequest
+from handlers.metrics import InstrumentedRequest
+from handlers.reload import register_module_handlers, reload_handlers
 from database.store import Store
+from database.journal import JournalPersistence
+from database.backend import BackendPersistence, SQLiteBackend
+from webhook_server import run_webhook
+from supervisor import run_worker
+
+IMPORTED_AT = time.perf_counter()
+# Filled in by post_init once the bot is ready; see /reload
+cold_start = {}
 
 # Configure logging
 logging.basicConfig(
@@ -33,9 +49,12 @@ async def help_command(update, context):
 
 Shopping:
 /products - Browse our product catalog
+/search - Search products by name or description
 /cart - View your shopping cart
 /pay - Process payment for your order
 /paypal - Get PayPal payment link
+/orders - View your order history
+/receipt - Show the receipt for an order, e.g. /receipt 42
 
 Support:
 /support - Request to talk with a support representative
@@ -49,6 +68,16 @@ Need assistance? Use /support to chat with our team!
 """
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+GIT_TIMEOUT = 300  # seconds before a git command is killed
+GIT_EDIT_INTERVAL = 1.5  # seconds between progress edits, to stay under Telegram's edit rate limit
+
+async def _edit_git_message(message, text):
+    try:
+        await message.edit_text(text)
+    except BadRequest:
+        # "Message is not modified" and similar are harmless while streaming
+        pass
+
 async def git_command(update, context):
     """Handle git commands from admin users"""
     user_id = update.effective_user.id
@@ -60,32 +89,61 @@ async def git_command(update, context):
         await update.message.reply_text("Please provide a git command. Example: /git pull")
         return
 
+    # Construct the git command
+    git_cmd = ['git'] + list(context.args)
+    header = f"$ {' '.join(git_cmd)}\n"
+    message = await update.message.reply_text(header + "Running...")
+
     try:
-        # Construct the git command
-        git_cmd = ['git'] + list(context.args)
-        
-        # Execute the git command and capture output
-        process = subprocess.Popen(
-            git_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+        # Run without blocking the event loop; stderr is merged so progress shows in order
+        process = await asyncio.create_subprocess_exec(
+            *git_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
         )
-        stdout, stderr = process.communicate()
+    except Exception as e:
+        await message.edit_text(f"Error executing git command: {str(e)}")
+        return
 
-        # Prepare response message
-        response = ""
-        if stdout:
-            response += f"Output:\n{stdout}\n"
-        if stderr:
-            response += f"Errors:\n{stderr}\n"
-        if not response:
-            response = "Command executed successfully with no output."
+    output = bytearray()
+    limit = MessageLimit.MAX_TEXT_LENGTH - len(header) - 100
 
-        await update.message.reply_text(response)
+    async def stream_output():
+        last_edit = time.monotonic()
+        while True:
+            chunk = await process.stdout.read(4096)
+            if not chunk:
+                break
+            output.extend(chunk)
+            if time.monotonic() - last_edit >= GIT_EDIT_INTERVAL:
+                last_edit = time.monotonic()
+                tail = output[-limit:].decode(errors='replace')
+                await _edit_git_message(message, header + tail)
+        await process.wait()
 
-    except Exception as e:
-        await update.message.reply_text(f"Error executing git command: {str(e)}")
+    status = ""
+    try:
+        await asyncio.wait_for(stream_output(), GIT_TIMEOUT)
+        if process.returncode:
+            status = f"\nExited with code {process.returncode}"
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        status = f"\nKilled after {GIT_TIMEOUT}s timeout"
+
+    text = output.decode(errors='replace')
+    if not text and not status:
+        text = "Command executed successfully with no output."
+
+    # Prepare response message
+    if len(text) <= limit:
+        await _edit_git_message(message, header + text + status)
+    else:
+        await _edit_git_message(message, header + "..." + text[-limit:] + status + "\nFull output attached.")
+        await update.message.reply_document(
+            document=io.BytesIO(output),
+            filename="git_output.txt"
+        )
 
 async def restart_command(update, context):
     """Handle bot restart from admin users"""
@@ -94,29 +152,56 @@ async def restart_command(update, context):
         await update.message.reply_text("Unauthorized access.")
         return
 
+    if os.getenv('BOT_MODE') == 'worker':
+        # Let the supervisor replace the workers one by one instead of dropping this one's work
+        os.kill(os.getppid(), signal.SIGHUP)
+        await update.message.reply_text("Rolling restart of all workers started...")
+        return
+
     await update.message.reply_text("Bot is restarting...")
     
     # Save any pending data
-    if hasattr(context.application, 'persistence'):
-        context.application.persistence.flush()
+    if context.application.persistence:
+        await context.application.update_persistence()
+        await context.application.persistence.flush()
     
     # Restart the process
     os.execl(sys.executable, sys.executable, *sys.argv)
 
-def main():
-    load_dotenv()
-    
-    # Initialize persistence
-    persistence = PicklePersistence(filepath="store_bot_data")
-    
-    # Initialize application
-    application = Application.builder()\
-        .token(os.getenv('BOT_TOKEN'))\
-        .persistence(persistence)\
-        .build()
-    
+async def reload_command(update, context):
+    """Re-import the handlers package and swap the handlers in place, keeping the store"""
+    user_id = update.effective_user.id
+    if user_id not in context.bot_data.get('admins', []):
+        await update.message.reply_text("Unauthorized access.")
+        return
+
+    if os.getenv('BOT_MODE') == 'worker':
+        # Other workers would keep the old code; the supervisor's rolling restart drops no updates
+        os.kill(os.getppid(), signal.SIGHUP)
+        await update.message.reply_text("Running several workers: rolling restart of all workers started instead...")
+        return
+
+    try:
+        elapsed = reload_handlers(context.application, register_handlers)
+    except Exception as e:
+        await update.message.reply_text(f"Reload failed, the previous handlers are still active:\n{type(e).__name__}: {e}")
+        return
+
+    text = f"Handlers reloaded in {elapsed * 1000:.0f} ms."
+    if cold_start:
+        text += f"\nA full restart took {cold_start['total']:.2f}s (imports {cold_start['imports']:.2f}s, loading data {cold_start['initialize']:.2f}s)."
+    await update.message.reply_text(text)
+
+async def sync_store(update, context):
+    """Catch up with changes other workers made to the shared store"""
+    store: Store = context.bot_data['store']
+    if store.backend is not None:
+        store.backend.sync(store)
+
+async def post_init(application):
+    # bot_data is only loaded from persistence during initialize, so defaults go here
     # Initialize store if not exists
-    if not hasattr(application.bot_data, 'store'):
+    if 'store' not in application.bot_data:
         application.bot_data['store'] = Store()
     
     # Initialize admins list if not exists
@@ -126,19 +211,88 @@ def main():
     
     # Add payment provider tokens to bot_data
     application.bot_data['payment_provider_token'] = os.getenv('PAYMENT_PROVIDER_TOKEN')
-    
-    # Register handlers
+
+    if not cold_start:
+        # initialize() has loaded persistence by now, so this is the time to a working bot
+        now = time.perf_counter()
+        cold_start.update(imports=IMPORTED_AT - STARTED_AT, initialize=now - IMPORTED_AT, total=now - STARTED_AT)
+        logging.getLogger(__name__).info(
+            "Cold start took %.2fs (imports %.2fs, build and initialize %.2fs)",
+            cold_start['total'], cold_start['imports'], cold_start['initialize']
+        )
+
+def build_application(token, persistence=None, concurrent_updates=1, request=None):
+    """Create the application and register every handler.
+
+    ``request`` replaces the HTTP transport for Bot API calls (see benchmarks/fake_bot.py).
+    """
+    builder = Application.builder()\
+        .token(token)\
+        .post_init(post_init)\
+        .concurrent_updates(concurrent_updates)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    # Every Bot API call except long polling is timed for /metrics
+    if request is not None:
+        builder = builder.request(InstrumentedRequest(request)).get_updates_request(request)
+    else:
+        builder = builder.request(InstrumentedRequest(HTTPXRequest(connection_pool_size=256)))
+    application = builder.build()
+    register_handlers(application)
+    return application
+
+def register_handlers(application):
+    """Register every handler; /reload calls this again after re-importing the handlers package"""
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('help', help_command))
-    application.add_handler(CommandHandler('git', git_command))
+    application.add_handler(CommandHandler('git', git_command, block=False))
     application.add_handler(CommandHandler('restart', restart_command))
-    register_admin_handlers(application)
-    register_customer_handlers(application)
-    register_support_handlers(application)
-    register_payment_handlers(application)
+    application.add_handler(CommandHandler('reload', reload_command))
+    register_module_handlers(application)
+    if os.getenv('BOT_MODE') == 'worker':
+        application.add_handler(TypeHandler(Update, sync_store), group=-1)
+
+def main():
+    load_dotenv()
+    
+    if os.getenv('BOT_MODE') == 'worker':
+        # Started by supervisor.py: the store is shared through SQLite, updates arrive on stdin
+        persistence = BackendPersistence(
+            filepath=f"store_bot_data_worker{os.getenv('WORKER_SLOT', '0')}",
+            backend=SQLiteBackend(os.getenv('STORE_DB', 'store_bot_data.sqlite')),
+            archive_path="store_bot_data_archive.sqlite"
+        )
+        application = build_application(
+            os.getenv('BOT_TOKEN'),
+            persistence=persistence,
+            concurrent_updates=int(os.getenv('CONCURRENT_UPDATES', '1'))
+        )
+        asyncio.run(run_worker(application, post_init))
+        return
+    
+    # Initialize persistence: the store is journaled, everything else is pickled
+    persistence = JournalPersistence(filepath="store_bot_data", fsync=os.getenv('JOURNAL_FSYNC', '1') != '0')
+    
+    # Initialize application
+    application = build_application(
+        os.getenv('BOT_TOKEN'),
+        persistence=persistence,
+        concurrent_updates=int(os.getenv('CONCURRENT_UPDATES', '1'))
+    )
     
     # Start the bot
-    application.run_polling()
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        asyncio.run(run_webhook(
+            application,
+            post_init,
+            host=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8443')),
+            webhook_url=os.getenv('WEBHOOK_URL'),
+            secret_token=os.getenv('WEBHOOK_SECRET'),
+            metrics_token=os.getenv('METRICS_TOKEN')
+        ))
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,267 @@
+"""Run the bot as several worker processes sharing one store.
+
+The supervisor owns the webhook endpoint (see webhook_server.py) and starts WORKERS
+copies of main.py with BOT_MODE=worker. Workers share the store through
+database/backend.py's SQLiteBackend, so stock, orders and support sessions stay
+consistent however updates are spread across them.
+
+Each Telegram update is routed by user id, so one user's updates always reach the
+same worker: their conversations and per-user ordering work as with one process.
+PayPal events go to every worker, since payment links live in the worker that made
+them; completing an order is atomic, so only one of them acts.
+
+Updates travel to a worker as JSON lines on its stdin. SIGHUP (or an admin's
+/restart) replaces the workers one at a time. The old process gets EOF, finishes what
+it already received, flushes its pickle (conversations, PayPal links) and exits; only
+then does the new one start and load that pickle. Updates for the slot are held by
+the supervisor in between and delivered in order once the new worker is ready.
+
+    WORKERS=4 WEBHOOK_URL=https://bot.example.com python supervisor.py
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import signal
+import sys
+from typing import Dict, List, Optional, Tuple, Union
+
+from telegram import Bot, Update
+
+from database.backend import SQLiteBackend
+from database.journal import StoreJournal
+from webhook_server import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+READY_LINE = b"ready\n"
+# How long a worker may take to start, and to finish its queue after EOF
+START_TIMEOUT = 60
+STOP_TIMEOUT = 60
+START_RETRY_DELAY = 5  # seconds before retrying a worker that failed to start during a restart
+
+def update_user_id(update: dict) -> int:
+    """The id updates are routed by: the sending user, else the chat, else 0"""
+    for value in update.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('user') or value.get('chat')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return 0
+
+class Worker:
+    def __init__(self, slot: int, process: asyncio.subprocess.Process):
+        self.slot = slot
+        self.process = process
+
+    async def send(self, message: dict):
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        await self.process.stdin.drain()
+
+    async def stop(self):
+        """Close stdin so the worker drains what it has and exits"""
+        if self.process.stdin and not self.process.stdin.is_closing():
+            self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Worker %d (pid %d) did not stop, killing it", self.slot, self.process.pid)
+            self.process.kill()
+            await self.process.wait()
+
+class Handover:
+    """Stands in for a slot's worker while it is replaced, keeping what arrives in order"""
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.pending: List[dict] = []
+
+    async def send(self, message: dict):
+        self.pending.append(message)
+
+class Supervisor(WebhookServer):
+    def __init__(self, workers: int, secret_token: Optional[str] = None):
+        super().__init__(None, secret_token)
+        self.size = workers
+        self.workers: List[Optional[Union[Worker, Handover]]] = [None] * workers
+        self._restarting = asyncio.Lock()
+        self._closing = False
+
+    async def _spawn(self, slot: int) -> Worker:
+        env = dict(os.environ, BOT_MODE='worker', WORKER_SLOT=str(slot), WORKER_COUNT=str(self.size))
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, MAIN_SCRIPT, env=env,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+        )
+        try:
+            await asyncio.wait_for(self._wait_ready(slot, process), START_TIMEOUT)
+        except (asyncio.TimeoutError, EOFError):
+            process.kill()
+            raise RuntimeError(f"Worker {slot} failed to start")
+        worker = Worker(slot, process)
+        loop = asyncio.get_running_loop()
+        loop.create_task(self._forward_output(worker))
+        loop.create_task(self._watch(worker))
+        logger.info("Worker %d started (pid %d)", slot, process.pid)
+        return worker
+
+    async def _wait_ready(self, slot: int, process: asyncio.subprocess.Process):
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                raise EOFError
+            if line == READY_LINE:
+                return
+            logger.info("worker %d: %s", slot, line.decode(errors='replace').rstrip())
+
+    async def _forward_output(self, worker: Worker):
+        # Keep the pipe drained so a worker printing to stdout never blocks
+        async for line in worker.process.stdout:
+            logger.info("worker %d: %s", worker.slot, line.decode(errors='replace').rstrip())
+
+    async def _watch(self, worker: Worker):
+        await worker.process.wait()
+        if self._closing or self.workers[worker.slot] is not worker:
+            return
+        logger.error("Worker %d exited with %s, restarting it", worker.slot, worker.process.returncode)
+        self.workers[worker.slot] = await self._spawn(worker.slot)
+
+    async def start_workers(self):
+        for slot in range(self.size):
+            self.workers[slot] = await self._spawn(slot)
+
+    async def rolling_restart(self):
+        """Replace each worker in turn; updates keep flowing to the other slots"""
+        async with self._restarting:
+            for slot in range(self.size):
+                old = self.workers[slot]
+                handover = self.workers[slot] = Handover(slot)
+                if old is not None:
+                    # Two processes on one slot would overwrite each other's pickle
+                    await old.stop()
+                while True:
+                    try:
+                        worker = await self._spawn(slot)
+                        break
+                    except RuntimeError:
+                        logger.exception("Restarting worker %d failed, retrying", slot)
+                        await asyncio.sleep(START_RETRY_DELAY)
+                # Messages that arrive while these are sent are appended and sent too
+                for message in handover.pending:
+                    await worker.send(message)
+                self.workers[slot] = worker
+            logger.info("Rolling restart finished")
+
+    async def stop_workers(self):
+        self._closing = True
+        await asyncio.gather(*(worker.stop() for worker in self.workers if isinstance(worker, Worker)))
+
+    async def dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Union[dict, str]]:
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'method not allowed'}
+            return 200, {
+                'status': 'ok',
+                'workers': [worker.process.pid if isinstance(worker, Worker) else None for worker in self.workers],
+            }
+
+        if path == '/telegram':
+            if method != 'POST':
+                return 405, {'error': 'method not allowed'}
+            if self.secret_token and not hmac.compare_digest(
+                headers.get('X-TELEGRAM-BOT-API-SECRET-TOKEN', ''), self.secret_token
+            ):
+                return 403, {'error': 'invalid secret token'}
+            try:
+                update = json.loads(body)
+                worker = self.workers[update_user_id(update) % self.size]
+            except (ValueError, AttributeError, TypeError):
+                return 400, {'error': 'invalid update'}
+            await worker.send({'update': update})
+            return 200, {'ok': True}
+
+        if path == '/paypal':
+            if method != 'POST':
+                return 405, {'error': 'method not allowed'}
+            message = {'paypal': {'body': body.decode('utf-8', errors='replace'), 'headers': headers}}
+            for worker in self.workers:
+                await worker.send(message)
+            return 200, {'ok': True}
+
+        return 404, {'error': 'not found'}
+
+async def run_supervisor(workers: int, host: str, port: int,
+                         webhook_url: Optional[str] = None, secret_token: Optional[str] = None):
+    supervisor = Supervisor(workers, secret_token)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    loop.add_signal_handler(signal.SIGHUP, lambda: loop.create_task(supervisor.rolling_restart()))
+
+    # Seed the shared database from the single-process journal on first start
+    backend = SQLiteBackend(os.getenv('STORE_DB', 'store_bot_data.sqlite'))
+    journal = StoreJournal('store_bot_data')
+    if backend.is_empty() and journal.snapshot_path.exists():
+        backend.load(fallback=journal.load())
+        await journal.close()
+    backend.close()
+
+    await supervisor.start_workers()
+    if webhook_url:
+        async with Bot(os.getenv('BOT_TOKEN')) as bot:
+            await bot.set_webhook(
+                url=f"{webhook_url.rstrip('/')}/telegram",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+    await supervisor.start(host, port)
+    try:
+        await stop.wait()
+    finally:
+        await supervisor.close()
+        await supervisor.stop_workers()
+
+async def run_worker(application, post_init):
+    """Worker side: process updates read from stdin until EOF"""
+    from handlers import payments
+
+    # Ctrl+C reaches the whole process group; the supervisor decides when we stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2 ** 22)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async with application:
+        await post_init(application)
+        await application.start()
+        sys.stdout.buffer.write(READY_LINE)
+        sys.stdout.flush()
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if 'update' in message:
+                    await application.update_queue.put(Update.de_json(message['update'], application.bot))
+                elif 'paypal' in message:
+                    await payments.handle_paypal_webhook(application, message['paypal']['body'], message['paypal']['headers'])
+        finally:
+            # Processes whatever is still queued before returning
+            await application.stop()
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(run_supervisor(
+        int(os.getenv('WORKERS', str(os.cpu_count() or 1))),
+        host=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', '8443')),
+        webhook_url=os.getenv('WEBHOOK_URL'),
+        secret_token=os.getenv('WEBHOOK_SECRET')
+    ))
+
+if __name__ == '__main__':
+    main()
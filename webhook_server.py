@@ -0,0 +1,167 @@
+"""Embedded HTTP server for webhook mode.
+
+Routes:
+    POST /telegram   Telegram updates, queued to the application like polled updates
+    POST /paypal     PayPal webhook events
+    GET  /health     JSON liveness/queue status
+    GET  /metrics    handler and Bot API metrics in Prometheus text format; only served
+                     when a metrics token is set, to requests bearing it
+                     (Authorization: Bearer <token>)
+
+It is deliberately minimal (HTTP/1.1, Content-Length bodies, one request per
+connection), which is all Telegram and PayPal need. Put it behind a TLS-terminating
+reverse proxy; Telegram only delivers webhooks over HTTPS.
+
+Recorded updates can be replayed locally, e.g.:
+    curl -X POST -H 'Content-Type: application/json' -d @update.json localhost:8443/telegram
+"""
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Dict, Optional, Tuple, Union
+
+from telegram import Update
+
+# Looked up through the module on each call, so /reload swaps it too
+from handlers import payments
+from handlers.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+            405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class WebhookServer:
+    def __init__(self, application, secret_token: Optional[str] = None, metrics_token: Optional[str] = None):
+        self.application = application
+        self.secret_token = secret_token
+        self.metrics_token = metrics_token
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str, port: int):
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info("Webhook server listening on %s:%s", host, port)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Union[dict, str]]:
+        """Route one request; headers are keyed by upper-case name.
+
+        Dict payloads are sent as JSON, strings as plain text.
+        """
+        if path == '/metrics' and self.metrics_token:
+            if not hmac.compare_digest(headers.get('AUTHORIZATION', ''), f"Bearer {self.metrics_token}"):
+                return 403, {'error': 'invalid metrics token'}
+            if method != 'GET':
+                return 405, {'error': 'method not allowed'}
+            return 200, REGISTRY.render_prometheus()
+
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': 'method not allowed'}
+            return 200, {
+                'status': 'ok' if self.application.running else 'stopped',
+                'update_queue': self.application.update_queue.qsize(),
+            }
+
+        if path == '/telegram':
+            if method != 'POST':
+                return 405, {'error': 'method not allowed'}
+            if self.secret_token and not hmac.compare_digest(
+                headers.get('X-TELEGRAM-BOT-API-SECRET-TOKEN', ''), self.secret_token
+            ):
+                return 403, {'error': 'invalid secret token'}
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+            except (ValueError, TypeError, KeyError):
+                return 400, {'error': 'invalid update'}
+            # Processing happens in the application's update loop, so reply right away
+            await self.application.update_queue.put(update)
+            return 200, {'ok': True}
+
+        if path == '/paypal':
+            if method != 'POST':
+                return 405, {'error': 'method not allowed'}
+            if not await payments.handle_paypal_webhook(self.application, body.decode('utf-8', errors='replace'), headers):
+                return 400, {'error': 'invalid webhook'}
+            return 200, {'ok': True}
+
+        return 404, {'error': 'not found'}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status, payload = 400, {'error': 'bad request'}
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().upper()] = value.strip()
+
+            length = int(headers.get('CONTENT-LENGTH', 0))
+            if length > MAX_BODY_SIZE:
+                status, payload = 413, {'error': 'payload too large'}
+            else:
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.dispatch(method.upper(), target.split('?', 1)[0], headers, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Error handling webhook request")
+            status, payload = 500, {'error': 'internal error'}
+
+        if isinstance(payload, str):
+            data, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            data, content_type = json.dumps(payload).encode(), 'application/json'
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def run_webhook(application, post_init, host: str, port: int,
+                      webhook_url: Optional[str] = None, secret_token: Optional[str] = None,
+                      metrics_token: Optional[str] = None):
+    """Run the application until SIGINT/SIGTERM, receiving updates through WebhookServer"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    server = WebhookServer(application, secret_token, metrics_token)
+    async with application:
+        # post_init is only called automatically by run_polling/run_webhook
+        await post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=f"{webhook_url.rstrip('/')}/telegram",
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        await application.start()
+        await server.start(host, port)
+        try:
+            await stop.wait()
+        finally:
+            await server.close()
+            await application.stop()